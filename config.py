@@ -1,41 +1,103 @@
 import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
+@dataclass(frozen=True)
 class Config:
     # Hugging Face Configuration
-    HUGGINGFACE_API_TOKEN = os.getenv("HUGGINGFACE_API_TOKEN")
-    HUGGINGFACE_MODEL = os.getenv("HUGGINGFACE_MODEL", "microsoft/DialoGPT-large")
+    HUGGINGFACE_API_TOKEN: Optional[str] = None
+    HUGGINGFACE_MODEL: str = "microsoft/DialoGPT-large"
     
     # Slack Configuration
-    SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
-    SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
+    SLACK_BOT_TOKEN: Optional[str] = None
+    SLACK_SIGNING_SECRET: Optional[str] = None
     
     # Twilio Configuration
-    TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
-    TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-    TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
+    TWILIO_ACCOUNT_SID: Optional[str] = None
+    TWILIO_AUTH_TOKEN: Optional[str] = None
+    TWILIO_PHONE_NUMBER: Optional[str] = None
     
     # Application Configuration
-    PORT = int(os.getenv("PORT", 8000))
-    CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
-    UPLOAD_DIRECTORY = os.getenv("UPLOAD_DIRECTORY", "./uploads")
+    PORT: int = 8000
+    MAX_CONCURRENT_RAG_JOBS: int = 2
+    CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
+    UPLOAD_DIRECTORY: str = "./uploads"
+    MAX_UPLOAD_BYTES: int = 20 * 1024 * 1024  # largest file accepted from chat uploads
+    MAX_PENDING_INGESTS: int = 4  # chat uploads queued or being indexed at once
+    
+    # Optional int8 ONNX export of the embedding model (see DEPLOYMENT.md)
+    EMBEDDING_ONNX_DIR: Optional[str] = None
+    
+    # On-disk cache of chunk embeddings, defaults to a file in CHROMA_PERSIST_DIRECTORY
+    EMBEDDING_CACHE_PATH: Optional[str] = None
     
     # RAG Configuration
-    CHUNK_SIZE = 1000
-    CHUNK_OVERLAP = 200
-    TOP_K_RESULTS = 5
+    CHUNK_WORDS: int = 1000  # words per chunk
+    OVERLAP_WORDS: int = 200  # words shared between neighbouring chunks
+    TOP_K_RESULTS: int = 5
+    EMBEDDING_BATCH_SIZE: int = 64
+    CONTEXT_MAX_TOKENS: int = 1500  # retrieved context passed to the LLM
+    RAG_CACHE_TTL: int = 3600  # seconds a cached answer stays fresh
+    
+    # Base URL of pre-recorded voice prompts (see VOICE_SETUP.md)
+    VOICE_PROMPTS_URL: Optional[str] = None
+    
+    # Web research HTTP client
+    WEB_CLIENT_TIMEOUT_MS: int = 10000
+    WEB_RETRIES: int = 1
+    
+    # On-disk cache of fetched web pages, defaults to a file in CHROMA_PERSIST_DIRECTORY
+    WEB_CACHE_PATH: Optional[str] = None
+    WEB_CACHE_TTL: int = 86400  # seconds a fetched page stays fresh
     
     @classmethod
-    def validate(cls):
+    def from_env(cls) -> "Config":
+        """Build a configuration snapshot from environment variables"""
+        chroma_dir = os.getenv("CHROMA_PERSIST_DIRECTORY", cls.CHROMA_PERSIST_DIRECTORY)
+        return cls(
+            HUGGINGFACE_API_TOKEN=os.getenv("HUGGINGFACE_API_TOKEN"),
+            HUGGINGFACE_MODEL=os.getenv("HUGGINGFACE_MODEL", cls.HUGGINGFACE_MODEL),
+            SLACK_BOT_TOKEN=os.getenv("SLACK_BOT_TOKEN"),
+            SLACK_SIGNING_SECRET=os.getenv("SLACK_SIGNING_SECRET"),
+            TWILIO_ACCOUNT_SID=os.getenv("TWILIO_ACCOUNT_SID"),
+            TWILIO_AUTH_TOKEN=os.getenv("TWILIO_AUTH_TOKEN"),
+            TWILIO_PHONE_NUMBER=os.getenv("TWILIO_PHONE_NUMBER"),
+            PORT=int(os.getenv("PORT", cls.PORT)),
+            MAX_CONCURRENT_RAG_JOBS=int(os.getenv("MAX_CONCURRENT_RAG_JOBS", cls.MAX_CONCURRENT_RAG_JOBS)),
+            CHROMA_PERSIST_DIRECTORY=chroma_dir,
+            UPLOAD_DIRECTORY=os.getenv("UPLOAD_DIRECTORY", cls.UPLOAD_DIRECTORY),
+            MAX_UPLOAD_BYTES=int(os.getenv("MAX_UPLOAD_BYTES", cls.MAX_UPLOAD_BYTES)),
+            MAX_PENDING_INGESTS=int(os.getenv("MAX_PENDING_INGESTS", cls.MAX_PENDING_INGESTS)),
+            CONTEXT_MAX_TOKENS=int(os.getenv("CONTEXT_MAX_TOKENS", cls.CONTEXT_MAX_TOKENS)),
+            RAG_CACHE_TTL=int(os.getenv("RAG_CACHE_TTL", cls.RAG_CACHE_TTL)),
+            VOICE_PROMPTS_URL=os.getenv("VOICE_PROMPTS_URL"),
+            WEB_CLIENT_TIMEOUT_MS=int(os.getenv("WEB_CLIENT_TIMEOUT_MS", cls.WEB_CLIENT_TIMEOUT_MS)),
+            WEB_RETRIES=int(os.getenv("WEB_RETRIES", cls.WEB_RETRIES)),
+            WEB_CACHE_PATH=os.getenv("WEB_CACHE_PATH", os.path.join(chroma_dir, "web_cache.sqlite")),
+            WEB_CACHE_TTL=int(os.getenv("WEB_CACHE_TTL", cls.WEB_CACHE_TTL)),
+            EMBEDDING_ONNX_DIR=os.getenv("EMBEDDING_ONNX_DIR"),
+            EMBEDDING_CACHE_PATH=os.getenv(
+                "EMBEDDING_CACHE_PATH", os.path.join(chroma_dir, "embedding_cache.sqlite3")
+            )
+        )
+    
+    def validate(self):
         """Validate required configuration"""
         required_vars = [
             "HUGGINGFACE_API_TOKEN"
         ]
         
-        missing_vars = [var for var in required_vars if not getattr(cls, var)]
+        missing_vars = [var for var in required_vars if not getattr(self, var)]
         if missing_vars:
             raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
         
-        return True
\ No newline at end of file
+        return True
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Read the environment once and share the resulting configuration"""
+    return Config.from_env()
\ No newline at end of file
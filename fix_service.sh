@@ -24,7 +24,7 @@ User=$CURRENT_USER
 Group=$CURRENT_USER
 WorkingDirectory=$CURRENT_DIR
 Environment=PATH=$CURRENT_DIR/venv/bin
-ExecStart=$CURRENT_DIR/venv/bin/python main.py
+ExecStart=$CURRENT_DIR/venv/bin/python serve.py
 ExecReload=/bin/kill -HUP \$MAINPID
 Restart=always
 RestartSec=10
@@ -1,42 +1,100 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, File, UploadFile, Request, Form, HTTPException
-from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 import uvicorn
 import os
 import logging
-from config import Config
-from rag_system import RAGSystem
+import logging.config
+import tempfile
+from config import get_config
+from rag_system import get_rag_system, close_llm_client, run_rag_job
 from slack_bot import SlackBot
 from whatsapp_bot import WhatsAppBot
+from web_research import WebResearcher
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+LOGGING_CONFIG = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "default": {"format": "%(levelname)s:%(name)s:%(message)s"}
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "default"}
+    },
+    "root": {"level": "INFO", "handlers": ["console"]}
+}
+logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
-# Initialize FastAPI app
-app = FastAPI(title="RAG Bot API", description="RAG Bot with Slack and WhatsApp integration")
+config = get_config()
 
-# Initialize components
-config = Config()
-rag_system = RAGSystem()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load heavy components once per worker before accepting requests"""
+    rag_system = get_rag_system()
+    await run_in_threadpool(rag_system.warmup)
+    app.state.rag = rag_system
+    app.state.researcher = WebResearcher(rag_system=rag_system)
+    app.state.rag_semaphore = asyncio.Semaphore(config.MAX_CONCURRENT_RAG_JOBS)
+    
+    # Initialize bots (only if credentials are available)
+    app.state.slack_bot = None
+    app.state.whatsapp_bot = None
+    app.state.voice_agent = None
+    
+    try:
+        if config.SLACK_BOT_TOKEN and config.SLACK_SIGNING_SECRET:
+            app.state.slack_bot = SlackBot(rag_system=rag_system)
+            logger.info("Slack bot initialized successfully")
+        else:
+            logger.warning("Slack credentials not configured")
+    except Exception as e:
+        logger.error("Failed to initialize Slack bot: %s", e)
+    
+    try:
+        app.state.whatsapp_bot = WhatsAppBot(rag_system=rag_system, researcher=app.state.researcher)
+        logger.info("WhatsApp bot initialized successfully")
+    except Exception as e:
+        logger.error("Failed to initialize WhatsApp bot: %s", e)
+    
+    # Voice integration
+    try:
+        from voice_agent import VoiceAgent
+        app.state.voice_agent = VoiceAgent(rag_system=rag_system)
+        logger.info("Voice agent initialized successfully")
+    except Exception as e:
+        logger.error("Failed to initialize voice agent: %s", e)
+    
+    yield
+    
+    close_llm_client()
 
-# Initialize bots (only if credentials are available)
-slack_bot = None
-whatsapp_bot = None
+# Initialize FastAPI app
+app = FastAPI(
+    title="RAG Bot API",
+    description="RAG Bot with Slack and WhatsApp integration",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
-try:
-    if config.SLACK_BOT_TOKEN and config.SLACK_SIGNING_SECRET:
-        slack_bot = SlackBot()
-        logger.info("Slack bot initialized successfully")
-    else:
-        logger.warning("Slack credentials not configured")
-except Exception as e:
-    logger.error(f"Failed to initialize Slack bot: {str(e)}")
+def _require(request: Request, name: str):
+    """Get an optional component from app state or respond 503"""
+    component = getattr(request.app.state, name, None)
+    if component is None:
+        raise HTTPException(status_code=503, detail=f"{name} is not configured")
+    return component
 
-try:
-    whatsapp_bot = WhatsAppBot()
-    logger.info("WhatsApp bot initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize WhatsApp bot: {str(e)}")
+async def _run_blocking(request: Request, fn, *args):
+    """Run blocking RAG work in the thread pool, capping concurrent jobs
+    
+    The asyncio semaphore keeps waiting requests off the thread pool; the job slot
+    inside is shared with uploads being indexed in the background.
+    """
+    async with request.app.state.rag_semaphore:
+        return await run_in_threadpool(run_rag_job, fn, *args)
 
 @app.get("/")
 async def root():
@@ -54,226 +112,237 @@ async def root():
     }
 
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint"""
+    state = request.app.state
     return {
         "status": "healthy",
-        "rag_system": "operational",
-        "slack_bot": "enabled" if slack_bot else "disabled",
-        "whatsapp_bot": "enabled" if whatsapp_bot else "disabled"
+        "rag_system": "operational" if getattr(state, "rag", None) else "starting",
+        "slack_bot": "enabled" if getattr(state, "slack_bot", None) else "disabled",
+        "whatsapp_bot": "enabled" if getattr(state, "whatsapp_bot", None) else "disabled"
     }
 
 @app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(request: Request, file: UploadFile = File(...)):
     """Upload a document to the RAG system"""
     try:
+        rag_system = request.app.state.rag
+        
         # Create uploads directory if it doesn't exist
         os.makedirs(config.UPLOAD_DIRECTORY, exist_ok=True)
         
-        # Read file content
-        content = await file.read()
-        
         if file.content_type == "application/pdf":
-            result = rag_system.add_pdf_document(content, file.filename)
+            # Stream the upload to disk in 1MB chunks instead of buffering it in memory
+            tmp = tempfile.NamedTemporaryFile(delete=False, dir=config.UPLOAD_DIRECTORY, suffix=".pdf")
+            try:
+                with tmp:
+                    while chunk := await file.read(1 << 20):
+                        tmp.write(chunk)
+                result = await _run_blocking(request, rag_system.add_pdf_document, tmp.name, file.filename)
+            finally:
+                os.remove(tmp.name)
             return {"message": result, "filename": file.filename}
         else:
             # Handle text files
+            content = await file.read()
             text_content = content.decode('utf-8')
-            result = rag_system.add_document(text_content, {"filename": file.filename})
+            result = await _run_blocking(request, rag_system.add_document, text_content, {"filename": file.filename})
             return {"message": result, "filename": file.filename}
     
     except Exception as e:
-        logger.error(f"Error uploading document: {str(e)}")
+        logger.error("Error uploading document: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/query")
-async def query_rag(request: dict):
+async def query_rag(payload: dict, request: Request):
     """Query the RAG system"""
     try:
-        question = request.get("question", "")
+        question = payload.get("question", "")
         if not question:
             raise HTTPException(status_code=400, detail="Question is required")
         
-        response = rag_system.query(question)
+        response = await _run_blocking(request, request.app.state.rag.query, question)
         return {"question": question, "answer": response}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error querying RAG system: {str(e)}")
+        logger.error("Error querying RAG system: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/stats")
-async def get_stats():
+async def get_stats(request: Request):
     """Get RAG system statistics"""
     try:
-        stats = rag_system.get_collection_stats()
+        stats = request.app.state.rag.get_collection_stats()
         return stats
     except Exception as e:
-        logger.error(f"Error getting stats: {str(e)}")
+        logger.error("Error getting stats: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/research/url")
-async def research_url(request: dict):
+async def research_url(payload: dict, request: Request):
     """Scrape a URL and add to knowledge base"""
     try:
-        from web_research import WebResearcher
-        researcher = WebResearcher()
-        
-        url = request.get("url", "")
+        url = payload.get("url", "")
         if not url:
             raise HTTPException(status_code=400, detail="URL is required")
         
-        result = researcher.add_url_to_knowledge_base(url)
+        result = await _run_blocking(request, request.app.state.researcher.add_url_to_knowledge_base, url)
         return {"result": result, "url": url}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error researching URL: {str(e)}")
+        logger.error("Error researching URL: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/research/topic")
-async def research_topic(request: dict):
+async def research_topic(payload: dict, request: Request):
     """Research a topic and add to knowledge base"""
     try:
-        from web_research import WebResearcher
-        researcher = WebResearcher()
-        
-        topic = request.get("topic", "")
+        topic = payload.get("topic", "")
         if not topic:
             raise HTTPException(status_code=400, detail="Topic is required")
         
-        num_sources = request.get("num_sources", 3)
-        result = researcher.research_topic(topic, num_sources)
+        num_sources = payload.get("num_sources", 3)
+        result = await _run_blocking(request, request.app.state.researcher.research_topic, topic, num_sources)
         return {"result": result, "topic": topic}
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error researching topic: {str(e)}")
+        logger.error("Error researching topic: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 # Slack integration
-if slack_bot:
-    @app.post("/slack/events")
-    async def slack_events(request: Request):
-        """Handle Slack events"""
-        return await slack_bot.get_handler().handle(request)
+@app.post("/slack/events")
+async def slack_events(request: Request):
+    """Handle Slack events"""
+    slack_bot = _require(request, "slack_bot")
+    return await slack_bot.get_handler().handle(request)
 
 # WhatsApp integration
-if whatsapp_bot:
-    @app.post("/whatsapp/webhook")
-    async def whatsapp_webhook(request: Request):
-        """Handle WhatsApp webhook"""
-        try:
-            form_data = await request.form()
-            from_number = form_data.get("From", "").replace("whatsapp:", "")
-            message_body = form_data.get("Body", "")
-            
-            # Check for media attachments
-            media_url = form_data.get("MediaUrl0", None)
-            media_type = form_data.get("MediaContentType0", None)
-            
-            if media_url:
-                logger.info(f"WhatsApp media from {from_number}: {media_type}")
-            else:
-                logger.info(f"WhatsApp message from {from_number}: {message_body}")
-            
-            # Process message with optional media
-            response_text = whatsapp_bot.handle_message(from_number, message_body, media_url, media_type)
-            
-            # Return TwiML response
-            twiml_response = whatsapp_bot.create_twiml_response(response_text)
-            return PlainTextResponse(content=twiml_response, media_type="application/xml")
+@app.post("/whatsapp/webhook")
+async def whatsapp_webhook(request: Request):
+    """Handle WhatsApp webhook"""
+    whatsapp_bot = _require(request, "whatsapp_bot")
+    try:
+        form_data = await request.form()
+        from_number = form_data.get("From", "").replace("whatsapp:", "")
+        message_body = form_data.get("Body", "")
         
-        except Exception as e:
-            logger.error(f"Error handling WhatsApp webhook: {str(e)}")
-            return PlainTextResponse(content="Error processing message", status_code=500)
+        # Check for media attachments
+        media_url = form_data.get("MediaUrl0", None)
+        media_type = form_data.get("MediaContentType0", None)
+        
+        if media_url:
+            logger.info("WhatsApp media from %s: %s", from_number, media_type)
+        else:
+            logger.info("WhatsApp message from %s: %s", from_number, message_body)
+        
+        # Process message with optional media; downloads, parsing and RAG calls block, so run them in the pool.
+        # Commands and downloads don't need a RAG slot; the bot takes one around queries and indexing
+        response_text = await run_in_threadpool(
+            whatsapp_bot.handle_message, from_number, message_body, media_url, media_type
+        )
+        
+        # Return TwiML response
+        twiml_response = whatsapp_bot.create_twiml_response(response_text)
+        return PlainTextResponse(content=twiml_response, media_type="application/xml")
+    
+    except Exception as e:
+        logger.error("Error handling WhatsApp webhook: %s", e)
+        return PlainTextResponse(content="Error processing message", status_code=500)
 
 # Voice integration
-try:
-    from voice_agent import VoiceAgent
-    voice_agent = VoiceAgent()
-    logger.info("Voice agent initialized successfully")
-    
-    @app.post("/voice/webhook")
-    async def voice_webhook(request: Request):
-        """Handle incoming voice calls"""
-        try:
-            form_data = await request.form()
-            from_number = form_data.get("From", "")
-            call_sid = form_data.get("CallSid", "")
-            
-            logger.info(f"Voice call from {from_number}, CallSid: {call_sid}")
-            
-            # Handle incoming call
-            twiml_response = voice_agent.handle_incoming_call(from_number)
-            return PlainTextResponse(content=twiml_response, media_type="application/xml")
+@app.post("/voice/webhook")
+async def voice_webhook(request: Request):
+    """Handle incoming voice calls"""
+    voice_agent = _require(request, "voice_agent")
+    try:
+        form_data = await request.form()
+        from_number = form_data.get("From", "")
+        call_sid = form_data.get("CallSid", "")
         
-        except Exception as e:
-            logger.error(f"Error handling voice webhook: {str(e)}")
-            return PlainTextResponse(content="<Response><Say>Error processing call</Say></Response>", media_type="application/xml")
+        logger.info("Voice call from %s, CallSid: %s", from_number, call_sid)
+        
+        # Handle incoming call
+        twiml_response = voice_agent.handle_incoming_call(from_number)
+        return PlainTextResponse(content=twiml_response, media_type="application/xml")
     
-    @app.post("/voice/process")
-    async def voice_process(request: Request):
-        """Process speech input from voice call"""
-        try:
-            form_data = await request.form()
-            speech_result = form_data.get("SpeechResult", "")
-            call_sid = form_data.get("CallSid", "")
-            
-            logger.info(f"Speech from {call_sid}: {speech_result}")
-            
-            # Check if this is a continuation decision
-            if call_sid in getattr(voice_agent, 'continuation_mode', set()):
-                twiml_response = voice_agent.handle_continue(speech_result)
-            else:
-                # Process the speech
-                twiml_response = voice_agent.process_speech(speech_result, call_sid)
-            
-            return PlainTextResponse(content=twiml_response, media_type="application/xml")
+    except Exception as e:
+        logger.error("Error handling voice webhook: %s", e)
+        return PlainTextResponse(content="<Response><Say>Error processing call</Say></Response>", media_type="application/xml")
+
+@app.post("/voice/process")
+async def voice_process(request: Request):
+    """Process speech input from voice call"""
+    voice_agent = _require(request, "voice_agent")
+    try:
+        form_data = await request.form()
+        speech_result = form_data.get("SpeechResult", "")
+        call_sid = form_data.get("CallSid", "")
+        
+        logger.info("Speech from %s: %s", call_sid, speech_result)
         
-        except Exception as e:
-            logger.error(f"Error processing speech: {str(e)}")
-            return PlainTextResponse(content="<Response><Say>Error processing speech</Say></Response>", media_type="application/xml")
+        # Check if this is a continuation decision
+        if call_sid in getattr(voice_agent, 'continuation_mode', set()):
+            twiml_response = voice_agent.handle_continue(speech_result)
+        else:
+            # Process the speech; the RAG query blocks, so run it in the pool
+            twiml_response = await _run_blocking(request, voice_agent.process_speech, speech_result, call_sid)
+        
+        return PlainTextResponse(content=twiml_response, media_type="application/xml")
     
-    @app.post("/sms/webhook")
-    async def sms_webhook(request: Request):
-        """Handle SMS messages (separate from WhatsApp)"""
-        try:
-            form_data = await request.form()
-            from_number = form_data.get("From", "")
-            message_body = form_data.get("Body", "")
-            
-            logger.info(f"SMS from {from_number}: {message_body}")
-            
-            # Use same WhatsApp bot logic for SMS
-            response_text = whatsapp_bot.handle_message(from_number, message_body)
-            
-            # Return TwiML response
-            twiml_response = whatsapp_bot.create_twiml_response(response_text)
-            return PlainTextResponse(content=twiml_response, media_type="application/xml")
+    except Exception as e:
+        logger.error("Error processing speech: %s", e)
+        return PlainTextResponse(content="<Response><Say>Error processing speech</Say></Response>", media_type="application/xml")
+
+@app.post("/sms/webhook")
+async def sms_webhook(request: Request):
+    """Handle SMS messages (separate from WhatsApp)"""
+    whatsapp_bot = _require(request, "whatsapp_bot")
+    try:
+        form_data = await request.form()
+        from_number = form_data.get("From", "")
+        message_body = form_data.get("Body", "")
+        
+        logger.info("SMS from %s: %s", from_number, message_body)
         
-        except Exception as e:
-            logger.error(f"Error handling SMS webhook: {str(e)}")
-            return PlainTextResponse(content="Error processing message", status_code=500)
+        # Use same WhatsApp bot logic for SMS
+        response_text = await run_in_threadpool(whatsapp_bot.handle_message, from_number, message_body)
+        
+        # Return TwiML response
+        twiml_response = whatsapp_bot.create_twiml_response(response_text)
+        return PlainTextResponse(content=twiml_response, media_type="application/xml")
     
-except Exception as e:
-    logger.error(f"Failed to initialize voice agent: {str(e)}")
+    except Exception as e:
+        logger.error("Error handling SMS webhook: %s", e)
+        return PlainTextResponse(content="Error processing message", status_code=500)
 
-if __name__ == "__main__":
+def run():
+    """Validate configuration and serve the API"""
     # Validate configuration
     try:
         config.validate()
         logger.info("Configuration validated successfully")
     except ValueError as e:
-        logger.error(f"Configuration error: {str(e)}")
+        logger.error("Configuration error: %s", e)
         exit(1)
     
     # Create necessary directories
     os.makedirs(config.CHROMA_PERSIST_DIRECTORY, exist_ok=True)
     os.makedirs(config.UPLOAD_DIRECTORY, exist_ok=True)
     
-    logger.info(f"Starting RAG Bot API on port {config.PORT}")
+    logger.info("Starting RAG Bot API on port %s", config.PORT)
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=config.PORT,
         reload=False,  # Disable reload for Raspberry Pi
         log_level="info"
-    )
\ No newline at end of file
+    )
+
+if __name__ == "__main__":
+    run()
\ No newline at end of file
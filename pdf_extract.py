@@ -0,0 +1,111 @@
+"""
+PDF Text Extraction
+Page text from PDFium, fanned out across worker processes for long documents
+"""
+
+import io
+import os
+import logging
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Union, BinaryIO, Iterator
+
+import pypdfium2 as pdfium
+import PyPDF2
+
+# Shorter documents are extracted in-process; starting the work elsewhere would cost more than it saves
+PARALLEL_MIN_PAGES = 32
+# Pages per worker task, so each task opens the document once for a whole range
+PAGES_PER_TASK = 16
+
+def _page_texts(pdf, start: int, stop: int) -> List[str]:
+    """Text of pages start..stop-1 of an open PDFium document"""
+    texts = []
+    for i in range(start, stop):
+        page = pdf[i]
+        textpage = page.get_textpage()
+        texts.append(textpage.get_text_range())
+        textpage.close()
+        page.close()
+    return texts
+
+def _extract_range(pdf_source: Union[bytes, str], start: int, stop: int) -> List[str]:
+    """Worker task: open the PDF and extract a range of pages"""
+    pdf = pdfium.PdfDocument(pdf_source)
+    try:
+        return _page_texts(pdf, start, stop)
+    finally:
+        pdf.close()
+
+@lru_cache(maxsize=1)
+def _get_pool() -> ProcessPoolExecutor:
+    """Start the extraction workers once; spawned, as forking a process with model threads is unsafe
+    
+    Spawned workers re-import the __main__ module, so the service is started
+    through serve.py, which imports nothing at module level.
+    """
+    return ProcessPoolExecutor(
+        max_workers=min(4, os.cpu_count() or 1),
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+def iter_pdf_pages(pdf_source: Union[bytes, str, BinaryIO]) -> Iterator[str]:
+    """Yield the text of each page of a PDF given as bytes, a file path or a binary file
+    
+    Uses PDFium and falls back to PyPDF2 for files PDFium cannot open. Documents of
+    PARALLEL_MIN_PAGES or more given as bytes or a path are split into page ranges
+    extracted by a process pool; pages are still yielded in order.
+    """
+    try:
+        pdf = pdfium.PdfDocument(pdf_source)
+    except Exception as e:
+        logging.warning("PDFium failed to parse PDF, falling back to PyPDF2: %s", e)
+        if isinstance(pdf_source, bytes):
+            pdf_source = io.BytesIO(pdf_source)
+        elif hasattr(pdf_source, "seek"):
+            pdf_source.seek(0)
+        for page in PyPDF2.PdfReader(pdf_source).pages:
+            yield page.extract_text() or ""
+        return
+    
+    try:
+        page_count = len(pdf)
+        if page_count < PARALLEL_MIN_PAGES or not isinstance(pdf_source, (bytes, str)):
+            for i in range(page_count):
+                yield _page_texts(pdf, i, i + 1)[0]
+            return
+    finally:
+        pdf.close()
+    
+    # Workers get a path, so the document isn't pickled again for every task
+    tmp_path = None
+    if isinstance(pdf_source, bytes):
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            tmp.write(pdf_source)
+        tmp_path = pdf_source = tmp.name
+    
+    try:
+        pool = _get_pool()
+        futures = [
+            pool.submit(_extract_range, pdf_source, start, min(start + PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PAGES_PER_TASK)
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            # Cancelled tasks never start; wait out running ones before removing their file
+            for future in futures:
+                if not future.cancelled():
+                    future.exception()
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+def extract_pdf_text(pdf_source: Union[bytes, str, BinaryIO]) -> str:
+    """Extract the text of every page of a PDF given as bytes, a file path or a binary file"""
+    return "\n".join(iter_pdf_pages(pdf_source))
@@ -1,38 +1,273 @@
 import os
+import glob
+import hashlib
+import sqlite3
 import requests
+import httpx
+import numpy as np
 import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any
-import PyPDF2
-import io
-from config import Config
+from typing import List, Dict, Any, Union, BinaryIO, Iterator, Optional
+from functools import lru_cache
+from cachetools import TTLCache
+import threading
+import logging
+from config import get_config
+from pdf_extract import extract_pdf_text
 from openai import OpenAI
+import tiktoken
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# HNSW index settings; Chroma only applies these when a collection is created
+HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+    "hnsw:M": 16
+}
+
+# Maximum number of chunks written to Chroma in a single add() call
+CHROMA_ADD_BATCH_SIZE = 512
+
+_INSTANCE = None
+
+# System prompt for RAG answers; only the retrieved context varies per call
+PROMPT_TPL = """You are an intelligent AI assistant that answers questions based on provided context.
+
+Context from knowledge base:
+{context}
+
+Guidelines:
+- Answer based only on the provided context
+- If the answer isn't in the context, say so clearly
+- Keep responses concise and helpful
+- Cite relevant information from the context"""
+
+class OnnxEmbedder:
+    """Sentence embeddings from an int8-quantized ONNX export of the model
+    
+    Mirrors the subset of SentenceTransformer.encode used in this project:
+    mean pooling over the last hidden state, optionally L2-normalized.
+    """
+    
+    def __init__(self, model_dir: str, max_seq_length: int = 256):
+        import onnxruntime
+        from transformers import AutoTokenizer
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = max_seq_length
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model_quantized.onnx"),
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [i.name for i in self.session.get_inputs()]
+    
+    def encode(self, sentences: List[str], batch_size: int = 32, convert_to_numpy: bool = True,
+               normalize_embeddings: bool = False, show_progress_bar: bool = False) -> np.ndarray:
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encoded = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feed = {name: encoded[name].astype(np.int64) for name in self._input_names}
+            hidden = self.session.run(None, feed)[0]
+            
+            # Mean pooling over non-padding tokens
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        
+        if not batches:
+            return np.zeros((0, self.session.get_outputs()[0].shape[-1]), dtype=np.float32)
+        return np.vstack(batches)
+
+@lru_cache(maxsize=None)
+def get_embedding_model(model_name: str = EMBEDDING_MODEL_NAME):
+    """Load the embedding model once per process and reuse it
+    
+    Uses the quantized ONNX export when EMBEDDING_ONNX_DIR is configured.
+    """
+    onnx_dir = get_config().EMBEDDING_ONNX_DIR
+    if onnx_dir and model_name == EMBEDDING_MODEL_NAME:
+        return OnnxEmbedder(onnx_dir)
+    return SentenceTransformer(model_name)
+
+def _quantize(vector: np.ndarray):
+    """Scale a vector into int8 by its largest absolute component"""
+    scale = float(np.abs(vector).max()) / 127 or 1.0
+    return scale, np.round(vector / scale).astype(np.int8).tobytes()
+
+def _dequantize(blob: bytes, scale: float) -> np.ndarray:
+    """Restore an int8 vector to float32 with unit length"""
+    vector = np.frombuffer(blob, dtype=np.int8).astype(np.float32) * scale
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class EmbeddingCache:
+    """Content-addressed SQLite cache of chunk embeddings
+    
+    Vectors are keyed by sha256 of the model id and chunk text, so re-ingesting
+    known text skips the encoder. They are stored as int8 with a per-vector
+    max-abs scale (388 bytes for MiniLM instead of 1536) and renormalized to unit
+    length on the way out.
+    """
+    
+    # Stay well below SQLite's limit on bound parameters per statement
+    _LOOKUP_BATCH = 500
+    
+    def __init__(self, path: str, model_id: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.model_id = model_id
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # Superseded float16 table
+        self._conn.execute("DROP TABLE IF EXISTS emb")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS emb_q8 (h TEXT PRIMARY KEY, scale REAL NOT NULL, vec BLOB NOT NULL)"
+        )
+        self._conn.commit()
+    
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode()).hexdigest()
+    
+    def encode(self, texts: List[str], encode_fn) -> np.ndarray:
+        """Return embeddings for texts, calling encode_fn only for cache misses"""
+        keys = [self._key(text) for text in texts]
+        found = {}
+        
+        with self._lock:
+            for start in range(0, len(keys), self._LOOKUP_BATCH):
+                batch = keys[start:start + self._LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(f"SELECT h, scale, vec FROM emb_q8 WHERE h IN ({placeholders})", batch)
+                for key, scale, blob in rows:
+                    found[key] = _dequantize(blob, scale)
+        
+        misses = list({key: i for i, key in enumerate(keys) if key not in found}.values())
+        if misses:
+            fresh = encode_fn([texts[i] for i in misses])
+            rows = []
+            for i, vector in zip(misses, fresh):
+                found[keys[i]] = np.asarray(vector, dtype=np.float32)
+                rows.append((keys[i], *_quantize(found[keys[i]])))
+            with self._lock:
+                self._conn.executemany("INSERT OR IGNORE INTO emb_q8 (h, scale, vec) VALUES (?, ?, ?)", rows)
+                self._conn.commit()
+        
+        return np.vstack([found[key] for key in keys])
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(path: str) -> EmbeddingCache:
+    """Open the on-disk embedding cache once per path"""
+    model_id = EMBEDDING_MODEL_NAME
+    if get_config().EMBEDDING_ONNX_DIR:
+        model_id += "-onnx-int8"
+    return EmbeddingCache(path, model_id)
+
+@lru_cache(maxsize=1)
+def get_llm_client() -> OpenAI:
+    """Shared GPT-OSS client whose connection pool is reused across requests"""
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=8),
+        timeout=30
+    )
+    return OpenAI(
+        base_url="https://router.huggingface.co/v1",
+        api_key=get_config().HUGGINGFACE_API_TOKEN,
+        http_client=http_client
+    )
+
+def close_llm_client():
+    """Close the shared GPT-OSS client if it was ever created
+    
+    Callers fetch the client with get_llm_client() on each request rather than
+    holding on to it, so a later request simply opens a new one.
+    """
+    if get_llm_client.cache_info().currsize:
+        get_llm_client().close()
+        get_llm_client.cache_clear()
+
+@lru_cache(maxsize=1)
+def get_rag_job_slots() -> threading.BoundedSemaphore:
+    """Process-wide cap on blocking RAG jobs, shared by request handlers and background ingests"""
+    return threading.BoundedSemaphore(get_config().MAX_CONCURRENT_RAG_JOBS)
+
+def run_rag_job(fn, *args):
+    """Run fn once one of the MAX_CONCURRENT_RAG_JOBS slots is free"""
+    with get_rag_job_slots():
+        return fn(*args)
+
+@lru_cache(maxsize=None)
+def get_chroma_client(path: str):
+    """Open a persistent ChromaDB client once per directory"""
+    return chromadb.PersistentClient(
+        path=path,
+        settings=Settings(anonymized_telemetry=False)
+    )
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """Load the o200k tokenizer used by GPT-OSS, or None if it is unavailable"""
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logging.warning("Tokenizer unavailable, truncating context by characters: %s", e)
+        return None
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to at most max_tokens model tokens"""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        # Roughly four characters per token for English text
+        return text[:max_tokens * 4]
+    
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return tokenizer.decode(tokens[:max_tokens])
+
+def _chunk_id(chunk: str) -> str:
+    """Stable ID derived from the chunk text"""
+    return hashlib.blake2b(chunk.encode(), digest_size=16).hexdigest()
+
+def get_rag_system() -> "RAGSystem":
+    """Return the process-wide RAGSystem, creating it on first use"""
+    global _INSTANCE
+    if _INSTANCE is None:
+        _INSTANCE = RAGSystem()
+    return _INSTANCE
 
 class RAGSystem:
     def __init__(self):
-        self.config = Config()
+        self.config = get_config()
         
         # Initialize ChromaDB
-        self.chroma_client = chromadb.PersistentClient(
-            path=self.config.CHROMA_PERSIST_DIRECTORY,
-            settings=Settings(anonymized_telemetry=False)
-        )
+        self.chroma_client = get_chroma_client(self.config.CHROMA_PERSIST_DIRECTORY)
         
         # Get or create collection
         self.collection = self.chroma_client.get_or_create_collection(
             name="documents",
-            metadata={"hnsw:space": "cosine"}
+            metadata=HNSW_METADATA
         )
         
         # Initialize sentence transformer for embeddings
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model = get_embedding_model()
+        self.embedding_cache = get_embedding_cache(self.config.EMBEDDING_CACHE_PATH)
         
-        # Initialize GPT-OSS client (same as your HeySalad implementation)
-        self.gpt_client = OpenAI(
-            base_url="https://router.huggingface.co/v1",
-            api_key=self.config.HUGGINGFACE_API_TOKEN
-        )
+        # Memoize query embeddings and final answers for repeated questions
+        self._embed_query = lru_cache(maxsize=1024)(self._encode_query)
+        self._answer_cache = TTLCache(maxsize=512, ttl=self.config.RAG_CACHE_TTL)
+        self._answer_cache_lock = threading.Lock()
         
     def add_document(self, text: str, metadata: Dict[str, Any] = None) -> str:
         """Add a document to the vector database"""
@@ -41,32 +276,65 @@ class RAGSystem:
             
         # Split text into chunks
         chunks = self._split_text(text)
+        if not chunks:
+            return "No text found in document"
+        
+        added = self._add_chunks({_chunk_id(chunk): (chunk, metadata) for chunk in chunks})
+        if not added:
+            return "Document already in knowledge base"
         
-        # Generate embeddings
-        embeddings = self.embedding_model.encode(chunks)
+        return f"Added {added} chunks from document"
+    
+    def add_documents(self, texts: List[str], metadatas: List[Dict[str, Any]]) -> str:
+        """Add several documents to the vector database with batched embedding and inserts"""
+        unique = {}
+        for text, metadata in zip(texts, metadatas):
+            for chunk in self._split_text(text):
+                unique.setdefault(_chunk_id(chunk), (chunk, metadata))
         
-        # Create unique IDs for chunks
-        doc_id = metadata.get('filename', 'doc')
-        chunk_ids = [f"{doc_id}_chunk_{i}" for i in range(len(chunks))]
+        if not unique:
+            return "No text found in documents"
         
-        # Add to ChromaDB
-        self.collection.add(
-            embeddings=embeddings.tolist(),
-            documents=chunks,
-            metadatas=[metadata] * len(chunks),
-            ids=chunk_ids
-        )
+        added = self._add_chunks(unique)
+        if not added:
+            return "Documents already in knowledge base"
         
-        return f"Added {len(chunks)} chunks from document"
+        return f"Added {added} chunks from {len(texts)} documents"
     
-    def add_pdf_document(self, pdf_content: bytes, filename: str) -> str:
-        """Extract text from PDF and add to vector database"""
-        try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-            text = ""
+    def _add_chunks(self, unique: Dict[str, tuple]) -> int:
+        """Embed and store (chunk, metadata) pairs keyed by content-hash ID, skipping stored ones"""
+        chunk_ids = list(unique)
+        
+        # Add to ChromaDB in bounded batches, embedding only chunks not already stored
+        added = 0
+        for start in range(0, len(chunk_ids), CHROMA_ADD_BATCH_SIZE):
+            batch_ids = chunk_ids[start:start + CHROMA_ADD_BATCH_SIZE]
+            existing = set(self.collection.get(ids=batch_ids, include=[])["ids"])
+            new_ids = [chunk_id for chunk_id in batch_ids if chunk_id not in existing]
+            if not new_ids:
+                continue
             
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
+            new_chunks = [unique[chunk_id][0] for chunk_id in new_ids]
+            embeddings = self.embedding_cache.encode(new_chunks, self._encode)
+            self.collection.add(
+                embeddings=embeddings.tolist(),
+                documents=new_chunks,
+                metadatas=[unique[chunk_id][1] for chunk_id in new_ids],
+                ids=new_ids
+            )
+            added += len(new_ids)
+        
+        if added:
+            # Cached answers may no longer reflect the knowledge base
+            with self._answer_cache_lock:
+                self._answer_cache.clear()
+        
+        return added
+    
+    def add_pdf_document(self, pdf_source: Union[bytes, str, BinaryIO], filename: str) -> str:
+        """Extract text from PDF bytes, a PDF file path or an open binary file and add to vector database"""
+        try:
+            text = extract_pdf_text(pdf_source)
             
             metadata = {"filename": filename, "type": "pdf"}
             return self.add_document(text, metadata)
@@ -80,12 +348,13 @@ class RAGSystem:
             top_k = self.config.TOP_K_RESULTS
             
         # Generate query embedding
-        query_embedding = self.embedding_model.encode([query])
+        query_embedding = self._embed_query(query)
         
         # Search in ChromaDB
         results = self.collection.query(
-            query_embeddings=query_embedding.tolist(),
-            n_results=top_k
+            query_embeddings=[list(query_embedding)],
+            n_results=top_k,
+            include=["documents", "metadatas", "distances"]
         )
         
         # Format results
@@ -102,47 +371,45 @@ class RAGSystem:
     
     def generate_response(self, query: str, context_docs: List[Dict[str, Any]]) -> str:
         """Generate response using GPT-OSS with RAG context (same approach as HeySalad)"""
-        # Prepare context from retrieved documents
-        context = "\n\n".join([doc['content'] for doc in context_docs])
-        
-        # Create system prompt for RAG
-        system_prompt = f"""You are an intelligent AI assistant that answers questions based on provided context.
-
-Context from knowledge base:
-{context[:2000]}
-
-Guidelines:
-- Answer based only on the provided context
-- If the answer isn't in the context, say so clearly
-- Keep responses concise and helpful
-- Cite relevant information from the context"""
-
         try:
-            # Use GPT-OSS via Hugging Face router (same as your HeySalad implementation)
-            response = self.gpt_client.chat.completions.create(
-                model="openai/gpt-oss-20b:fireworks-ai",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": query}
-                ],
-                max_tokens=300,
-                temperature=0.7
-            )
-            
-            # Handle the response properly
-            if response.choices and response.choices[0].message:
-                content = response.choices[0].message.content
-                if content and content.strip():
-                    return content.strip()
-            
-            # Fallback if response is None or empty
-            raise Exception("Empty response from GPT-OSS")
-            
+            return self._complete(query, context_docs)
         except Exception as e:
             print(f"GPT-OSS error: {str(e)}")
             # Fallback to simple context-based response
             return self._generate_fallback_response(query, context_docs)
     
+    def _build_messages(self, query: str, context_docs: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Chat messages asking GPT-OSS to answer query from the retrieved documents"""
+        # Prepare context from retrieved documents
+        context = "\n\n".join([doc['content'] for doc in context_docs])
+        
+        # Create system prompt for RAG
+        context = truncate_to_tokens(context, self.config.CONTEXT_MAX_TOKENS)
+        system_prompt = PROMPT_TPL.format(context=context)
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": query}
+        ]
+    
+    def _complete(self, query: str, context_docs: List[Dict[str, Any]]) -> str:
+        """Ask GPT-OSS for an answer, raising if none is produced"""
+        # Use GPT-OSS via Hugging Face router (same as your HeySalad implementation)
+        response = get_llm_client().chat.completions.create(
+            model="openai/gpt-oss-20b:fireworks-ai",
+            messages=self._build_messages(query, context_docs),
+            max_tokens=300,
+            temperature=0.7
+        )
+        
+        # Handle the response properly
+        if response.choices and response.choices[0].message:
+            content = response.choices[0].message.content
+            if content and content.strip():
+                return content.strip()
+        
+        raise Exception("Empty response from GPT-OSS")
+    
     def _generate_fallback_response(self, query: str, context_docs: List[Dict[str, Any]]) -> str:
         """Generate a simple response based on context when FlexaAI API is not available"""
         if not context_docs:
@@ -165,25 +432,138 @@ Guidelines:
     
     def query(self, question: str) -> str:
         """Main query method that combines search and generation"""
+        cache_key = " ".join(question.lower().split())
+        with self._answer_cache_lock:
+            cached = self._answer_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         # Search for relevant documents
         relevant_docs = self.search_documents(question)
         
         if not relevant_docs:
             return "I couldn't find any relevant information in the knowledge base to answer your question."
         
-        # Generate response with context
-        return self.generate_response(question, relevant_docs)
+        # Generate response with context; fallback excerpts are not cached
+        try:
+            answer = self._complete(question, relevant_docs)
+        except Exception as e:
+            logging.error("GPT-OSS error: %s", e)
+            return self._generate_fallback_response(question, relevant_docs)
+        
+        with self._answer_cache_lock:
+            self._answer_cache[cache_key] = answer
+        return answer
+    
+    def stream_query(self, question: str, max_chars: Optional[int] = None) -> Iterator[str]:
+        """Like query, but yield the answer in pieces as GPT-OSS generates it
+        
+        Closing the generator early stops generation and caches nothing. With max_chars,
+        generation stops once more than max_chars have been yielded, and the shortened
+        answer is cached under its own key so later full-length queries never see it.
+        """
+        cache_key = " ".join(question.lower().split())
+        with self._answer_cache_lock:
+            cached = self._answer_cache.get(cache_key)
+            if cached is None and max_chars is not None:
+                cached = self._answer_cache.get((cache_key, max_chars))
+        if cached is not None:
+            yield cached
+            return
+        
+        relevant_docs = self.search_documents(question)
+        if not relevant_docs:
+            yield "I couldn't find any relevant information in the knowledge base to answer your question."
+            return
+        
+        parts = []
+        length = 0
+        truncated = False
+        try:
+            stream = get_llm_client().chat.completions.create(
+                model="openai/gpt-oss-20b:fireworks-ai",
+                messages=self._build_messages(question, relevant_docs),
+                max_tokens=300,
+                temperature=0.7,
+                stream=True
+            )
+            try:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield parts[-1]
+                        length += len(parts[-1])
+                        if max_chars is not None and length > max_chars:
+                            truncated = True
+                            break
+            finally:
+                stream.response.close()
+        except Exception as e:
+            logging.error("GPT-OSS error: %s", e)
+            if not parts:
+                yield self._generate_fallback_response(question, relevant_docs)
+            return
+        
+        answer = "".join(parts).strip()
+        if answer:
+            with self._answer_cache_lock:
+                self._answer_cache[(cache_key, max_chars) if truncated else cache_key] = answer
+        else:
+            yield self._generate_fallback_response(question, relevant_docs)
+    
+    def _encode_query(self, query: str) -> tuple:
+        """Embed a single query as a hashable tuple"""
+        return tuple(self._encode([query])[0].tolist())
+    
+    def _encode(self, texts: List[str]):
+        """Embed texts in mini-batches as unit-length vectors"""
+        return self.embedding_model.encode(
+            texts,
+            batch_size=self.config.EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
     
     def _split_text(self, text: str) -> List[str]:
-        """Split text into chunks for better retrieval"""
+        """Split text into overlapping word windows for better retrieval"""
+        chunk_words = self.config.CHUNK_WORDS
         words = text.split()
-        chunks = []
         
-        for i in range(0, len(words), self.config.CHUNK_SIZE - self.config.CHUNK_OVERLAP):
-            chunk = " ".join(words[i:i + self.config.CHUNK_SIZE])
-            chunks.append(chunk)
+        # Fast path: the whole document fits in a single chunk
+        if len(words) <= chunk_words:
+            return [" ".join(words)] if words else []
         
-        return chunks
+        # Stop once a window reaches the end so the tail isn't re-embedded
+        # as chunks that are fully contained in the previous one
+        stride = max(1, chunk_words - self.config.OVERLAP_WORDS)
+        last_start = len(words) - chunk_words
+        return [
+            " ".join(words[i:i + chunk_words])
+            for i in range(0, last_start + stride, stride)
+        ]
+    
+    def warmup(self):
+        """Run a throwaway encode and search so the first real query isn't cold"""
+        vector = self._encode(["warmup"])[0]
+        
+        # Ask the kernel to page in the HNSW index files ahead of the first search
+        if hasattr(os, "posix_fadvise"):
+            pattern = os.path.join(self.config.CHROMA_PERSIST_DIRECTORY, "*", "*.bin")
+            for path in glob.glob(pattern):
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                    try:
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                    finally:
+                        os.close(fd)
+                except OSError:
+                    pass
+        
+        try:
+            self.collection.query(query_embeddings=[vector.tolist()], n_results=1, include=[])
+        except Exception:
+            pass
     
     def get_collection_stats(self) -> Dict[str, Any]:
         """Get statistics about the document collection"""
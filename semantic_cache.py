@@ -0,0 +1,96 @@
+"""
+Semantic Answer Cache
+Reuses answers for rephrased questions by matching query embeddings
+"""
+
+import itertools
+import threading
+from typing import Hashable, Optional
+
+import numpy as np
+from cachetools import TTLCache
+
+class SemanticCache:
+    """Answers keyed by normalized query embedding, found via random-projection LSH
+    
+    Each embedding is sign-hashed against `bits` random hyperplanes. Lookups probe
+    the embedding's bucket and every bucket one bit away, and return the most
+    similar stored answer whose cosine similarity reaches `threshold`. Entries are
+    grouped by a caller-supplied scope (e.g. user and knowledge-base version) and
+    expire like a TTLCache.
+    """
+    
+    def __init__(self, dim: int, bits: int = 16, threshold: float = 0.95,
+                 maxsize: int = 2048, ttl: float = 3600, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((bits, dim)).astype(np.float32)
+        self._powers = 1 << np.arange(bits, dtype=np.int64)
+        self._bits = bits
+        self.threshold = threshold
+        
+        # key -> (embedding, answer); buckets hold keys and are pruned lazily
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._buckets = {}
+        self._indexed = 0
+        self._keys = itertools.count()
+        self._lock = threading.Lock()
+    
+    def _bucket(self, embedding: np.ndarray) -> int:
+        """Sign-hash an embedding into an integer bucket"""
+        return int(self._powers[self._planes @ embedding > 0].sum())
+    
+    def get(self, scope: Hashable, embedding: np.ndarray) -> Optional[str]:
+        """Return the closest cached answer in scope, or None"""
+        bucket = self._bucket(embedding)
+        probes = [bucket] + [bucket ^ (1 << i) for i in range(self._bits)]
+        
+        best, best_score = None, self.threshold
+        with self._lock:
+            for probe in probes:
+                keys = self._buckets.get((scope, probe))
+                if not keys:
+                    continue
+                for key in list(keys):
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        keys.discard(key)
+                        self._indexed -= 1
+                        continue
+                    score = float(entry[0] @ embedding)
+                    if score >= best_score:
+                        best, best_score = entry[1], score
+        return best
+    
+    def put(self, scope: Hashable, embedding: np.ndarray, answer: str):
+        """Cache an answer for a query embedding"""
+        bucket = self._bucket(embedding)
+        with self._lock:
+            key = next(self._keys)
+            self._entries[key] = (embedding, answer)
+            self._buckets.setdefault((scope, bucket), set()).add(key)
+            self._indexed += 1
+            
+            # Drop keys of evicted or expired entries once they dominate the index
+            if self._indexed > 2 * self._entries.maxsize:
+                self._reindex()
+    
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._indexed = 0
+    
+    def _reindex(self):
+        """Remove bucket keys whose entries are gone"""
+        self._entries.expire()
+        live_keys = set(self._entries)
+        live = 0
+        for bucket_key in list(self._buckets):
+            keys = self._buckets[bucket_key]
+            keys &= live_keys
+            if keys:
+                live += len(keys)
+            else:
+                del self._buckets[bucket_key]
+        self._indexed = live
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+RAG Bot service entry point
+
+Deliberately imports nothing at module level: PDF extraction workers are
+started with the spawn method and re-import this module as __mp_main__, so
+anything imported here would be loaded again in every worker.
+"""
+
+if __name__ == "__main__":
+    from main import run
+    run()
@@ -1,13 +1,42 @@
 import os
+import shutil
+import tempfile
+import requests
+from requests.adapters import HTTPAdapter
 from slack_bolt import App
 from slack_bolt.adapter.fastapi import SlackRequestHandler
-from rag_system import RAGSystem
-from config import Config
+from rag_system import RAGSystem, get_rag_system
+from config import get_config
+
+# Keep-alive connections to files.slack.com for file downloads
+_http = requests.Session()
+_http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+HELP_TEXT = """
+🤖 *RAG Bot Help*
+
+I can help you find information from uploaded documents. Here's what you can do:
+
+• Ask me questions about any topic in the knowledge base
+• Upload documents by mentioning me with a file attachment
+• Use `stats` to see knowledge base statistics
+• Use `hello` to get a greeting
+• Use `help` to see this message
+
+Just mention me (@ragbot) followed by your question!
+            """
+
+STATS_TEMPLATE = """
+📊 *Knowledge Base Statistics*
+
+• Total document chunks: {total_documents}
+• Collection: {collection_name}
+                """
 
 class SlackBot:
-    def __init__(self):
-        self.config = Config()
-        self.rag_system = RAGSystem()
+    def __init__(self, rag_system: RAGSystem = None):
+        self.config = get_config()
+        self.rag_system = rag_system or get_rag_system()
         
         # Initialize Slack app
         self.app = App(
@@ -24,43 +53,13 @@ class SlackBot:
     def _setup_handlers(self):
         """Set up Slack event handlers"""
         
-        @self.app.message("hello")
-        def handle_hello(message, say):
-            """Handle hello messages"""
-            say(f"Hello <@{message['user']}>! I'm your RAG bot. Ask me anything about the documents in my knowledge base!")
-        
-        @self.app.message("help")
-        def handle_help(message, say):
-            """Handle help messages"""
-            help_text = """
-🤖 *RAG Bot Help*
-
-I can help you find information from uploaded documents. Here's what you can do:
-
-• Ask me questions about any topic in the knowledge base
-• Upload documents by mentioning me with a file attachment
-• Use `stats` to see knowledge base statistics
-• Use `hello` to get a greeting
-• Use `help` to see this message
-
-Just mention me (@ragbot) followed by your question!
-            """
-            say(help_text)
-        
-        @self.app.message("stats")
-        def handle_stats(message, say):
-            """Handle stats request"""
-            try:
-                stats = self.rag_system.get_collection_stats()
-                stats_text = f"""
-📊 *Knowledge Base Statistics*
-
-• Total document chunks: {stats['total_documents']}
-• Collection: {stats['collection_name']}
-                """
-                say(stats_text)
-            except Exception as e:
-                say(f"Error getting stats: {str(e)}")
+        @self.app.event("message")
+        def handle_message(message, say):
+            """Dispatch exact-match commands from plain messages"""
+            text = message.get("text", "").strip().lower()
+            handler = self._HANDLERS.get(text)
+            if handler:
+                handler(self, message, say)
         
         @self.app.event("app_mention")
         def handle_app_mention(event, say):
@@ -106,28 +105,53 @@ _Powered by FlexaAI RAG System_
                 file_data = file_info['file']
                 
                 if file_data['mimetype'] == 'application/pdf':
-                    # Download file content
+                    # Stream the file into a spooled buffer instead of holding the response body
                     file_url = file_data['url_private']
                     headers = {'Authorization': f'Bearer {self.config.SLACK_BOT_TOKEN}'}
                     
-                    import requests
-                    response = requests.get(file_url, headers=headers)
-                    
-                    if response.status_code == 200:
+                    with _http.get(file_url, headers=headers, stream=True) as response, \
+                            tempfile.SpooledTemporaryFile(max_size=8 << 20) as buf:
+                        if response.status_code != 200:
+                            say("❌ Failed to download the file")
+                            return
+                        
+                        response.raw.decode_content = True
+                        shutil.copyfileobj(response.raw, buf, length=1 << 20)
+                        buf.seek(0)
+                        
                         # Add to RAG system
-                        result = self.rag_system.add_pdf_document(
-                            response.content, 
-                            file_data['name']
-                        )
-                        say(f"✅ Successfully processed: {file_data['name']}\n{result}")
-                    else:
-                        say("❌ Failed to download the file")
+                        result = self.rag_system.add_pdf_document(buf, file_data['name'])
+                    
+                    say(f"✅ Successfully processed: {file_data['name']}\n{result}")
                 else:
                     say("📄 I currently only support PDF files. Please upload a PDF document.")
                     
             except Exception as e:
                 say(f"Error processing file: {str(e)}")
     
+    def _handle_hello(self, message, say):
+        """Handle hello messages"""
+        say(f"Hello <@{message['user']}>! I'm your RAG bot. Ask me anything about the documents in my knowledge base!")
+    
+    def _handle_help(self, message, say):
+        """Handle help messages"""
+        say(HELP_TEXT)
+    
+    def _handle_stats(self, message, say):
+        """Handle stats request"""
+        try:
+            stats = self.rag_system.get_collection_stats()
+            say(STATS_TEMPLATE.format(**stats))
+        except Exception as e:
+            say(f"Error getting stats: {str(e)}")
+    
+    # Commands recognised in plain channel messages
+    _HANDLERS = {
+        "hello": _handle_hello,
+        "help": _handle_help,
+        "stats": _handle_stats
+    }
+    
     def get_handler(self):
         """Get the FastAPI handler"""
         return self.handler
\ No newline at end of file
@@ -18,4 +18,4 @@ fi
 
 # Start the application
 echo "🚀 Launching RAG Bot API..."
-python3 main.py
\ No newline at end of file
+python3 serve.py
\ No newline at end of file
@@ -1,145 +1,75 @@
 #!/usr/bin/env python3
 """
-Test script for RAG Bot API
+Tests for RAG Bot API
+
+Requests go straight to the ASGI app in-process, so no server needs to be
+running. Run with: pytest test_api.py
 """
 
-import requests
-import json
-import time
+import httpx
+import pytest
+import pytest_asyncio
 
-BASE_URL = "http://localhost:8000"
+from main import app
 
-def test_health():
-    """Test health endpoint"""
-    print("🔍 Testing health endpoint...")
-    try:
-        response = requests.get(f"{BASE_URL}/health")
-        print(f"Status: {response.status_code}")
-        print(f"Response: {json.dumps(response.json(), indent=2)}")
-        return response.status_code == 200
-    except Exception as e:
-        print(f"❌ Health check failed: {e}")
-        return False
+SAMPLE_TEXT = """
+Artificial Intelligence (AI) is a branch of computer science that aims to create
+intelligent machines that work and react like humans. Some of the activities
+computers with artificial intelligence are designed for include:
 
-def test_stats():
-    """Test stats endpoint"""
-    print("\n📊 Testing stats endpoint...")
-    try:
-        response = requests.get(f"{BASE_URL}/stats")
-        print(f"Status: {response.status_code}")
-        print(f"Response: {json.dumps(response.json(), indent=2)}")
-        return response.status_code == 200
-    except Exception as e:
-        print(f"❌ Stats test failed: {e}")
-        return False
+- Speech recognition
+- Learning
+- Planning
+- Problem solving
 
-def test_query():
-    """Test query endpoint"""
-    print("\n🤖 Testing query endpoint...")
-    try:
-        test_question = "What is artificial intelligence?"
-        payload = {"question": test_question}
-        
-        response = requests.post(
-            f"{BASE_URL}/query",
-            json=payload,
-            headers={"Content-Type": "application/json"}
-        )
-        
-        print(f"Status: {response.status_code}")
-        print(f"Question: {test_question}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"Answer: {result.get('answer', 'No answer')}")
-        else:
-            print(f"Error: {response.text}")
-        
-        return response.status_code == 200
-    except Exception as e:
-        print(f"❌ Query test failed: {e}")
-        return False
+Machine Learning is a subset of AI that provides systems the ability to
+automatically learn and improve from experience without being explicitly programmed.
+"""
 
-def test_upload():
-    """Test upload endpoint with sample text"""
-    print("\n📄 Testing upload endpoint...")
-    try:
-        # Create a sample text file
-        sample_text = """
-        Artificial Intelligence (AI) is a branch of computer science that aims to create 
-        intelligent machines that work and react like humans. Some of the activities 
-        computers with artificial intelligence are designed for include:
-        
-        - Speech recognition
-        - Learning
-        - Planning
-        - Problem solving
-        
-        Machine Learning is a subset of AI that provides systems the ability to 
-        automatically learn and improve from experience without being explicitly programmed.
-        """
-        
-        files = {
-            'file': ('sample_doc.txt', sample_text, 'text/plain')
-        }
-        
-        response = requests.post(f"{BASE_URL}/upload", files=files)
-        
-        print(f"Status: {response.status_code}")
-        if response.status_code == 200:
-            result = response.json()
-            print(f"Upload result: {result}")
-        else:
-            print(f"Error: {response.text}")
-        
-        return response.status_code == 200
-    except Exception as e:
-        print(f"❌ Upload test failed: {e}")
-        return False
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def client():
+    """Start the app (and its RAG system) once for the whole test session"""
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            yield c
 
-def main():
-    """Run all tests"""
-    print("🧪 Starting RAG Bot API Tests")
-    print("=" * 50)
-    
-    # Wait a moment for server to be ready
-    print("⏳ Waiting for server to be ready...")
-    time.sleep(2)
-    
-    tests = [
-        ("Health Check", test_health),
-        ("Stats", test_stats),
-        ("Upload Document", test_upload),
-        ("Query System", test_query),
-    ]
+@pytest.mark.asyncio(loop_scope="session")
+class TestAPI:
+    async def test_health(self, client):
+        """Test health endpoint"""
+        response = await client.get("/health")
+        assert response.status_code == 200
+        assert response.json()["status"] == "healthy"
     
-    results = []
-    for test_name, test_func in tests:
-        print(f"\n{'='*20} {test_name} {'='*20}")
-        success = test_func()
-        results.append((test_name, success))
-        
-        if success:
-            print(f"✅ {test_name} passed")
-        else:
-            print(f"❌ {test_name} failed")
+    async def test_stats(self, client):
+        """Test stats endpoint"""
+        response = await client.get("/stats")
+        assert response.status_code == 200
+        assert "total_documents" in response.json()
     
-    # Summary
-    print(f"\n{'='*50}")
-    print("📋 Test Summary:")
-    passed = sum(1 for _, success in results if success)
-    total = len(results)
+    async def test_upload(self, client):
+        """Test upload endpoint with sample text"""
+        files = {'file': ('sample_doc.txt', SAMPLE_TEXT, 'text/plain')}
+        response = await client.post("/upload", files=files)
+        assert response.status_code == 200, response.text
+        assert response.json()["filename"] == "sample_doc.txt"
     
-    for test_name, success in results:
-        status = "✅ PASS" if success else "❌ FAIL"
-        print(f"  {test_name}: {status}")
+    async def test_query(self, client):
+        """Test query endpoint"""
+        response = await client.post("/query", json={"question": "What is artificial intelligence?"})
+        assert response.status_code == 200, response.text
+        assert response.json()["answer"]
     
-    print(f"\nResults: {passed}/{total} tests passed")
+    async def test_query_requires_question(self, client):
+        """Test query endpoint rejects an empty question"""
+        response = await client.post("/query", json={})
+        assert response.status_code == 400, response.text
     
-    if passed == total:
-        print("🎉 All tests passed! RAG Bot is working correctly.")
-    else:
-        print("⚠️  Some tests failed. Check the logs and configuration.")
+    async def test_research_url_requires_url(self, client):
+        """Test research endpoint rejects a missing URL"""
+        response = await client.post("/research/url", json={})
+        assert response.status_code == 400, response.text
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(pytest.main([__file__, "-q"]))
\ No newline at end of file
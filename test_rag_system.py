@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for text chunking in the shared RAG system
+
+Run with: pytest test_rag_system.py
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from rag_system import RAGSystem
+
+CHUNK_WORDS = 4
+OVERLAP_WORDS = 1
+
+@pytest.fixture
+def rag():
+    """RAGSystem with only the chunking settings, no model or database"""
+    system = RAGSystem.__new__(RAGSystem)
+    system.config = SimpleNamespace(CHUNK_WORDS=CHUNK_WORDS, OVERLAP_WORDS=OVERLAP_WORDS)
+    return system
+
+def _words(n: int) -> str:
+    return " ".join(f"w{i}" for i in range(n))
+
+@pytest.mark.parametrize("text", ["", "   \n "])
+def test_empty_text_has_no_chunks(rag, text):
+    assert rag._split_text(text) == []
+
+def test_text_shorter_than_window(rag):
+    """Short text is one chunk with its whitespace collapsed"""
+    assert rag._split_text("w0  w1\nw2") == ["w0 w1 w2"]
+
+def test_text_exactly_one_window(rag):
+    """A document of exactly CHUNK_WORDS words isn't followed by an overlap-only chunk"""
+    assert rag._split_text(_words(CHUNK_WORDS)) == [_words(CHUNK_WORDS)]
+
+@pytest.mark.parametrize("n, expected", [
+    # Last window ends exactly on the final word
+    (10, ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]),
+    # One word past a window boundary gets a short final chunk
+    (11, ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9", "w9 w10"]),
+    (5, ["w0 w1 w2 w3", "w3 w4"]),
+])
+def test_multi_window(rag, n, expected):
+    assert rag._split_text(_words(n)) == expected
+
+@pytest.mark.parametrize("n", range(CHUNK_WORDS + 1, 40))
+def test_windows_overlap_and_cover_text_once(rag, n):
+    """Neighbouring chunks share OVERLAP_WORDS words and none is a trailing duplicate"""
+    words = _words(n).split()
+    chunks = [chunk.split() for chunk in rag._split_text(_words(n))]
+    
+    assert chunks[0][0] == words[0]
+    assert chunks[-1][-1] == words[-1]
+    for prev, chunk in zip(chunks, chunks[1:]):
+        assert len(prev) == CHUNK_WORDS
+        assert prev[-OVERLAP_WORDS:] == chunk[:OVERLAP_WORDS]
+        # Only the final chunk reaches the end of the text
+        assert prev[-1] != words[-1]
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
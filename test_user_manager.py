@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Tests for the JSON journal behind the user, session and document stores
+
+Run with: pytest test_user_manager.py
+"""
+
+import os
+import time
+
+import orjson
+import pytest
+
+from user_manager import JsonJournal
+
+def _wait_for(condition, timeout: float = 5.0):
+    """Poll until the journal's writer thread has done its work"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "journal writer did not catch up"
+        time.sleep(0.01)
+
+def _wal_lines(journal: JsonJournal) -> int:
+    if not os.path.exists(journal.wal_path):
+        return 0
+    with open(journal.wal_path, 'rb') as f:
+        return len(f.read().splitlines())
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "users.json")
+
+def test_replays_puts_and_deletes(path):
+    """Changes still only in the change log are replayed on reopen"""
+    journal = JsonJournal(path, flush_interval=60)
+    try:
+        journal.put("alice", {"name": "Alice"})
+        journal.put("bob", {"name": "Bob"})
+        journal.put("alice", {"name": "Alice B"})
+        journal.delete("bob")
+        _wait_for(lambda: _wal_lines(journal) == 4)
+        
+        # No snapshot yet, so everything comes from the log
+        assert not os.path.exists(path)
+        reopened = JsonJournal(path, flush_interval=60)
+        try:
+            assert reopened.data == {"alice": {"name": "Alice B"}}
+        finally:
+            reopened.close()
+    finally:
+        journal.close()
+
+def test_ignores_torn_final_line(path):
+    """A change log cut off mid-line by a crash loads up to the last whole record"""
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps({"alice": 1}))
+    with open(path + ".wal", 'wb') as f:
+        f.write(b'{"k":"bob","v":2}\n{"k":"alice"}\n{"k":"carol","v":{"na')
+    
+    journal = JsonJournal(path)
+    try:
+        assert journal.data == {"bob": 2}
+    finally:
+        journal.close()
+
+def test_snapshot_truncates_log(path):
+    """Settled changes are written to the snapshot and the log emptied"""
+    journal = JsonJournal(path, flush_interval=0.05)
+    try:
+        journal.put("alice", {"name": "Alice"})
+        journal.put("bob", {"name": "Bob"})
+        journal.delete("alice")
+        _wait_for(lambda: os.path.exists(path) and _wal_lines(journal) == 0)
+        
+        with open(path, 'rb') as f:
+            assert orjson.loads(f.read()) == {"bob": {"name": "Bob"}}
+    finally:
+        journal.close()
+    
+    reopened = JsonJournal(path)
+    try:
+        assert reopened.data == {"bob": {"name": "Bob"}}
+    finally:
+        reopened.close()
+
+def test_close_writes_final_snapshot(path):
+    """Closing flushes queued changes into the snapshot"""
+    journal = JsonJournal(path, flush_interval=60)
+    journal.put("alice", [1, 2, 3])
+    journal.close()
+    
+    assert os.path.getsize(path + ".wal") == 0
+    with open(path, 'rb') as f:
+        assert orjson.loads(f.read()) == {"alice": [1, 2, 3]}
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
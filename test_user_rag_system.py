@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-user RAG system
+
+Answer caching runs against a fake embedder and LLM; chunking uses the real
+embedding model's tokenizer. Run with: pytest test_user_rag_system.py
+"""
+
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+import pytest
+from cachetools import TTLCache
+
+from semantic_cache import SemanticCache
+from user_rag_system import UserRAGSystem
+from rag_system import get_embedding_model
+
+DIM = 8
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+# Two phrasings of the same question, close enough to share a cached answer
+EMBEDDINGS = {
+    "What is my refund policy?": _unit([1, 0.02, 0, 0, 0, 0, 0, 0]),
+    "what's the refund policy again?": _unit([1, 0, 0.03, 0, 0, 0, 0, 0]),
+    "Who wrote the contract?": _unit([0, 0, 0, 0, 1, 0, 0, 0]),
+}
+
+@pytest.fixture
+def rag():
+    """UserRAGSystem with an in-memory history and a fake embedder and LLM"""
+    system = UserRAGSystem.__new__(UserRAGSystem)
+    history = []
+    system.user_manager = mock.Mock()
+    system.user_manager.get_conversation_context.side_effect = lambda user_id, channel: list(history)
+    system.user_manager.add_message_to_session.side_effect = (
+        lambda user_id, role, content, channel: history.append((role, content))
+    )
+    system._embed_query = lambda question: tuple(EMBEDDINGS[question].tolist())
+    system._search_cache = TTLCache(maxsize=16, ttl=300)
+    system._search_cache_lock = threading.Lock()
+    system._user_versions = {}
+    system._conversation_epochs = {}
+    system._answer_cache = SemanticCache(DIM)
+    system._search_user_documents = mock.Mock(return_value=[])
+    system._generate_contextual_response = mock.Mock(
+        side_effect=lambda question, docs, context: f"answer {len(context)}"
+    )
+    return system
+
+def test_rephrased_follow_up_hits_cache(rag):
+    """A rephrased question later in the conversation reuses the cached answer"""
+    first = rag.query_with_context("u1", "What is my refund policy?")
+    second = rag.query_with_context("u1", "what's the refund policy again?")
+    
+    assert second == first
+    assert rag._generate_contextual_response.call_count == 1
+
+def test_different_question_misses_cache(rag):
+    """An unrelated question is answered afresh"""
+    rag.query_with_context("u1", "What is my refund policy?")
+    rag.query_with_context("u1", "Who wrote the contract?")
+    
+    assert rag._generate_contextual_response.call_count == 2
+
+def test_clear_conversation_retires_cached_answers(rag):
+    """Answers cached before clear_conversation are not reused after it"""
+    rag.query_with_context("u1", "What is my refund policy?")
+    rag.clear_conversation("u1")
+    rag.query_with_context("u1", "what's the refund policy again?")
+    
+    assert rag._generate_contextual_response.call_count == 2
+
+# Mixed case, punctuation, runs of spaces and line breaks that chunking must keep
+SOURCE_PARAGRAPH = (
+    "The Quarterly Report for ACME Corp.  shows Revenue of $4.2M,\n"
+    "up 12% year-over-year; see Appendix B (pp. 14-17) for details.\n\n"
+    "\tNext steps:  Hire 3 Engineers, ship v2.0, and REVIEW pricing.   "
+)
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    """The embedding model's own tokenizer, which _split_text counts with"""
+    return get_embedding_model().tokenizer
+
+@pytest.fixture
+def splitter(tokenizer):
+    system = UserRAGSystem.__new__(UserRAGSystem)
+    system.embedding_model = SimpleNamespace(tokenizer=tokenizer)
+    return system
+
+def test_split_empty_text(splitter):
+    assert splitter._split_text("") == []
+
+def test_split_short_text_is_one_verbatim_chunk(splitter):
+    """A text under the limit comes back as-is, minus surrounding whitespace"""
+    assert splitter._split_text(SOURCE_PARAGRAPH) == [SOURCE_PARAGRAPH.strip()]
+
+@pytest.mark.parametrize("chunk_tokens, overlap", [(254, 32), (40, 8)])
+def test_split_chunks_fit_model_and_preserve_text(splitter, tokenizer, chunk_tokens, overlap):
+    """Every chunk fits the token limit and is a verbatim slice of the source"""
+    text = SOURCE_PARAGRAPH * 40
+    chunks = splitter._split_text(text, chunk_tokens=chunk_tokens, overlap=overlap)
+    
+    assert len(chunks) > 1
+    start, end = -1, 0
+    for i, chunk in enumerate(chunks):
+        tokens = tokenizer(chunk, add_special_tokens=False, verbose=False)["input_ids"]
+        assert len(tokens) <= chunk_tokens
+        
+        # Slices appear in order, each starting before the previous one ended (overlap)
+        found = text.find(chunk, start + 1)
+        assert found > start
+        if i:
+            assert found < end
+        start, end = found, found + len(chunk)
+    
+    assert chunks[0] == text[:len(chunks[0])]
+    assert text.rstrip().endswith(chunks[-1])
+    # Case and inner whitespace survive, unlike a decode of the token ids
+    assert any("ACME Corp.  shows" in chunk for chunk in chunks)
+    assert any("\n\n\tNext" in chunk for chunk in chunks)
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
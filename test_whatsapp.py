@@ -4,6 +4,26 @@ Simple test script for WhatsApp webhook functionality
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# One pooled session so repeated requests reuse the same connection
+SESSION = requests.Session()
+adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    # Only retry when the request was never processed (connection refused, 429, 503);
+    # re-posting after a read error or a 500 could deliver a message twice
+    max_retries=Retry(
+        total=3,
+        read=0,
+        backoff_factor=1,
+        status_forcelist=[429, 503],
+        allowed_methods=["POST", "GET"]
+    )
+)
+SESSION.mount('https://', adapter)
+SESSION.mount('http://', adapter)
 
 def test_whatsapp_webhook():
     """Test WhatsApp webhook locally"""
@@ -20,10 +40,11 @@ def test_whatsapp_webhook():
     print(f"Test message: {test_data['Body']}")
     
     try:
-        response = requests.post(
+        response = SESSION.post(
             url,
             data=test_data,
-            headers={"Content-Type": "application/x-www-form-urlencoded"}
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            timeout=(5, 10)
         )
         
         print(f"Status: {response.status_code}")
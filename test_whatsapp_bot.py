@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for WhatsApp command parsing
+
+Messages go through WhatsAppBot.handle_message with its handlers replaced by
+recorders, and the outcome is compared with the original strip/lower/partition
+parser. Run with: pytest test_whatsapp_bot.py
+"""
+
+from unittest import mock
+
+import pytest
+
+from whatsapp_bot import WhatsAppBot
+
+USER = {"user_id": "u1", "name": "Alice"}
+
+def _legacy_dispatch(message_body: str):
+    """The command parsing handle_message used before the regex"""
+    body = message_body.strip()
+    if body.lower() in WhatsAppBot._COMMANDS:
+        return ("command", body.lower())
+    word, _, argument = body.partition(' ')
+    if word.lower() in WhatsAppBot._ARG_COMMANDS and argument.strip():
+        return ("arg_command", word.lower(), argument.strip())
+    return ("query", message_body)
+
+@pytest.fixture
+def bot():
+    """WhatsAppBot whose command handlers and RAG query only record how they were called"""
+    instance = WhatsAppBot.__new__(WhatsAppBot)
+    instance.user_manager = mock.Mock()
+    instance.user_manager.get_or_create_user.return_value = USER
+    instance.user_rag_system = mock.Mock()
+    instance.user_rag_system.query_with_context.return_value = "answer"
+    
+    def command(name):
+        return lambda self, user: ("command", name)
+    
+    def arg_command(name):
+        return lambda self, user_id, argument: ("arg_command", name, argument)
+    
+    commands = {name: command(name) for name in WhatsAppBot._COMMANDS}
+    arg_commands = {name: arg_command(name) for name in WhatsAppBot._ARG_COMMANDS}
+    with mock.patch.dict(WhatsAppBot._COMMANDS, commands), \
+            mock.patch.dict(WhatsAppBot._ARG_COMMANDS, arg_commands), \
+            mock.patch("whatsapp_bot.run_rag_job", lambda fn, *args: fn(*args)):
+        yield instance
+
+def _dispatch(bot, message_body: str):
+    """What handle_message did with a message, in _legacy_dispatch's terms"""
+    result = bot.handle_message("+15550100", message_body)
+    if result == "🤖 answer":
+        return ("query", bot.user_rag_system.query_with_context.call_args[0][1])
+    return result
+
+MESSAGES = [
+    # Exact commands, any case, with surrounding whitespace
+    "help", "HELP", "Help", "?", "  hi  ", "\thello\n", "Start", "stats", "clear\r\n",
+    # Commands with extra words are ordinary questions
+    "help me", "hi there", "stats please", "clear the table", "hello?",
+    # Argument commands
+    "research healthy diets", "Research  Healthy Diets ", "SCRAPE https://example.com/a?b=1",
+    "  scrape   https://example.com  ", "research multi\nline\ntopic", "research a \n b \n",
+    # Argument commands without an argument, or not separated by a space
+    "research", "research   ", "scrape\n", "research\ttopic", "research\ntopic",
+    "researching diets", "scraper url",
+    # Unicode look-alikes that case-insensitive matching would otherwise accept
+    "ſtats", "hİ", "ſcrape https://example.com",
+    # Ordinary messages
+    "", "   ", "What is in my PDF?", "tell me about research", "x" * 5000,
+]
+
+@pytest.mark.parametrize("message_body", MESSAGES)
+def test_dispatch_matches_legacy_parser(bot, message_body):
+    assert _dispatch(bot, message_body) == _legacy_dispatch(message_body)
+
+def test_argument_keeps_case_and_inner_whitespace(bot):
+    """Arguments are passed through as typed, only trimmed at the ends"""
+    assert _dispatch(bot, "research  Pasta   Recipes\nfrom Italy  ") == (
+        "arg_command", "research", "Pasta   Recipes\nfrom Italy"
+    )
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -4,55 +4,230 @@ Handles user accounts, sessions, and private knowledge bases
 """
 
 import os
-import json
+import orjson
 import hashlib
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Dict, List, Optional, Any
 import chromadb
 from chromadb.config import Settings
 
+# Queue sentinel asking a journal writer thread to finish
+_STOP = object()
+
+# Messages kept per session for conversation context
+MAX_SESSION_MESSAGES = 10
+
+def _to_epoch(value) -> int:
+    """Convert a stored timestamp to epoch seconds, accepting legacy ISO strings"""
+    if isinstance(value, str):
+        return int(datetime.fromisoformat(value).timestamp())
+    return value
+
+@dataclass
+class Message:
+    """One turn of a conversation"""
+    __slots__ = ("role", "content", "timestamp")
+    role: str  # "user" or "assistant"
+    content: str
+    timestamp: int
+
+@dataclass
+class Session:
+    """Recent conversation history of a user on one channel"""
+    __slots__ = ("session_id", "user_id", "channel", "started_at", "last_activity", "messages")
+    session_id: str
+    user_id: str
+    channel: str
+    started_at: int
+    last_activity: int
+    messages: deque
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Session":
+        """Build a session from its stored form, upgrading legacy records"""
+        messages = (
+            Message(m["role"], m["content"], _to_epoch(m["timestamp"]))
+            for m in data.get("messages", [])
+        )
+        return cls(
+            session_id=data["session_id"],
+            user_id=data["user_id"],
+            channel=data["channel"],
+            started_at=_to_epoch(data["started_at"]),
+            last_activity=_to_epoch(data["last_activity"]),
+            messages=deque(messages, maxlen=MAX_SESSION_MESSAGES)
+        )
+
+class JsonJournal:
+    """A JSON object file kept up to date through an append-only change log
+    
+    Changes are queued and written by a background thread, so callers never wait
+    on disk. Each change appends one line to ``<path>.wal``; at most every
+    ``flush_interval`` seconds the full snapshot is written to ``path`` and the log
+    emptied. Loading replays the log over the last snapshot.
+    """
+    
+    def __init__(self, path: str, flush_interval: float = 5.0):
+        self.path = path
+        self.wal_path = path + ".wal"
+        self.flush_interval = flush_interval
+        # Serialized value of every key, owned by the writer thread
+        self._encoded = {}
+        self.data = self._load()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._run, name=f"journal-{os.path.basename(path)}", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+    
+    def _load(self) -> Dict:
+        """Read the snapshot and replay the change log on top of it"""
+        data = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                data = orjson.loads(f.read())
+        
+        if os.path.exists(self.wal_path):
+            with open(self.wal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        break  # torn final line from a crash
+                    if "v" in record:
+                        data[record["k"]] = record["v"]
+                    else:
+                        data.pop(record["k"], None)
+        
+        self._encoded = {key: orjson.dumps(value) for key, value in data.items()}
+        return data
+    
+    def put(self, key: str, value: Any):
+        """Record the current value of a key"""
+        # Serialize now, the caller may keep mutating value
+        self._queue.put((key, orjson.dumps(value, default=list)))
+    
+    def delete(self, key: str):
+        """Record the removal of a key"""
+        self._queue.put((key, None))
+    
+    def close(self):
+        """Write any queued changes and a final snapshot"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=10)
+    
+    def _run(self):
+        """Writer thread: append queued changes, snapshot once they settle"""
+        with open(self.wal_path, 'ab') as wal:
+            deadline = None
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    items = [self._queue.get(timeout=timeout)]
+                except queue.Empty:
+                    self._snapshot(wal)
+                    deadline = None
+                    continue
+                
+                # Drain everything already queued into one write
+                while True:
+                    try:
+                        items.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                
+                lines = []
+                for item in items:
+                    if item is _STOP:
+                        continue
+                    key, encoded = item
+                    if encoded is None:
+                        self._encoded.pop(key, None)
+                        lines.append(orjson.dumps({"k": key}))
+                    else:
+                        self._encoded[key] = encoded
+                        lines.append(b'{"k":' + orjson.dumps(key) + b',"v":' + encoded + b'}')
+                
+                if lines:
+                    wal.write(b"\n".join(lines) + b"\n")
+                    wal.flush()
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                
+                if _STOP in items:
+                    self._snapshot(wal)
+                    return
+    
+    def _snapshot(self, wal):
+        """Write a compact snapshot and truncate the change log
+        
+        The snapshot and its rename are synced to disk first, so a crash never
+        leaves both an empty change log and a snapshot that didn't survive.
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b"{" + b",".join(
+                orjson.dumps(key) + b":" + encoded for key, encoded in self._encoded.items()
+            ) + b"}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        wal.truncate(0)
+
 class UserManager:
     def __init__(self, data_dir: str = "./user_data"):
         self.data_dir = data_dir
         self.users_file = os.path.join(data_dir, "users.json")
         self.sessions_file = os.path.join(data_dir, "sessions.json")
+        self.documents_file = os.path.join(data_dir, "documents.json")
         
         # Create data directory
         os.makedirs(data_dir, exist_ok=True)
         
         # Load or initialize users and sessions
-        self.users = self._load_users()
-        self.sessions = self._load_sessions()
+        self._users_journal = JsonJournal(self.users_file)
+        self._sessions_journal = JsonJournal(self.sessions_file)
+        self.users = self._users_journal.data
+        self.sessions = self._sessions_journal.data
+        # Per-document metadata, shared by all of a document's chunks
+        self._documents_journal = JsonJournal(self.documents_file)
+        self.documents = self._documents_journal.data
+        for user in self.users.values():
+            user["created_at"] = _to_epoch(user["created_at"])
+        for session_key, session in self.sessions.items():
+            self.sessions[session_key] = Session.from_dict(session)
         
         # Initialize ChromaDB client for user collections
         self.chroma_client = chromadb.PersistentClient(
             path=os.path.join(data_dir, "chroma_db"),
             settings=Settings(anonymized_telemetry=False)
         )
+        
+        # Collection handles by user_id, so lookups skip Chroma's metadata query
+        self._collections = {}
+        # Chunk counts by user_id, loaded from Chroma on first use
+        self._chunk_counts = {}
+    
+    def _save_user(self, user_id: str):
+        """Journal the current state of one user"""
+        self._users_journal.put(user_id, self.users[user_id])
     
-    def _load_users(self) -> Dict:
-        """Load users from file"""
-        if os.path.exists(self.users_file):
-            with open(self.users_file, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def _save_users(self):
-        """Save users to file"""
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users, f, indent=2)
-    
-    def _load_sessions(self) -> Dict:
-        """Load sessions from file"""
-        if os.path.exists(self.sessions_file):
-            with open(self.sessions_file, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def _save_sessions(self):
-        """Save sessions to file"""
-        with open(self.sessions_file, 'w') as f:
-            json.dump(self.sessions, f, indent=2)
+    def _save_session(self, session_key: str):
+        """Journal the current state of one session"""
+        self._sessions_journal.put(session_key, self.sessions[session_key])
     
     def get_or_create_user(self, phone_number: str, name: Optional[str] = None) -> Dict:
         """Get existing user or create new one"""
@@ -64,57 +239,85 @@ class UserManager:
                 "user_id": user_id,
                 "phone_number": phone_number,
                 "name": name or f"User_{user_id[:8]}",
-                "created_at": datetime.now().isoformat(),
+                "created_at": int(time.time()),
                 "total_messages": 0,
                 "total_documents": 0,
                 "collection_name": f"user_{user_id}"
             }
-            self._save_users()
+            self._save_user(user_id)
             
             # Create user's private collection
             self._create_user_collection(user_id)
         
         return self.users[user_id]
     
-    def _hash_phone(self, phone_number: str) -> str:
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _hash_phone(phone_number: str) -> str:
         """Hash phone number for privacy"""
-        return hashlib.sha256(phone_number.encode()).hexdigest()[:16]
+        # Same value as sha256(...).hexdigest()[:16]; user IDs and collection names depend on it
+        return hashlib.sha256(phone_number.encode()).digest()[:8].hex()
     
     def _create_user_collection(self, user_id: str):
         """Create a private ChromaDB collection for user"""
         collection_name = f"user_{user_id}"
         try:
-            self.chroma_client.get_or_create_collection(
+            # Embeddings are unit-length, so inner product ranks exactly like cosine
+            self._collections[user_id] = self.chroma_client.get_or_create_collection(
                 name=collection_name,
-                metadata={"hnsw:space": "cosine"}
+                metadata={"hnsw:space": "ip"}
             )
         except Exception as e:
             print(f"Error creating collection for {user_id}: {str(e)}")
     
     def get_user_collection(self, user_id: str):
         """Get user's private collection"""
-        collection_name = f"user_{user_id}"
-        return self.chroma_client.get_collection(name=collection_name)
+        collection = self._collections.get(user_id)
+        if collection is None:
+            collection_name = f"user_{user_id}"
+            collection = self.chroma_client.get_collection(name=collection_name)
+            self._collections[user_id] = collection
+        return collection
+    
+    def get_chunk_count(self, user_id: str) -> int:
+        """Number of chunks in user's private collection"""
+        count = self._chunk_counts.get(user_id)
+        if count is None:
+            count = self.get_user_collection(user_id).count()
+            self._chunk_counts[user_id] = count
+        return count
+    
+    def add_chunk_count(self, user_id: str, added: int):
+        """Record chunks added to user's private collection"""
+        self._chunk_counts[user_id] = self.get_chunk_count(user_id) + added
     
-    def get_or_create_session(self, user_id: str, channel: str = "whatsapp") -> Dict:
+    def save_document_metadata(self, doc_id: str, metadata: Dict[str, Any]):
+        """Store metadata for a document in a user's knowledge base"""
+        self.documents[doc_id] = metadata
+        self._documents_journal.put(doc_id, metadata)
+    
+    def get_document_metadata(self, doc_id: str) -> Dict[str, Any]:
+        """Get stored metadata for a document"""
+        return self.documents.get(doc_id, {})
+    
+    def get_or_create_session(self, user_id: str, channel: str = "whatsapp") -> Session:
         """Get or create conversation session"""
         session_key = f"{user_id}_{channel}"
+        now = int(time.time())
         
         if session_key not in self.sessions:
-            self.sessions[session_key] = {
-                "session_id": session_key,
-                "user_id": user_id,
-                "channel": channel,
-                "started_at": datetime.now().isoformat(),
-                "last_activity": datetime.now().isoformat(),
-                "messages": [],
-                "context": []
-            }
-            self._save_sessions()
+            self.sessions[session_key] = Session(
+                session_id=session_key,
+                user_id=user_id,
+                channel=channel,
+                started_at=now,
+                last_activity=now,
+                messages=deque(maxlen=MAX_SESSION_MESSAGES)
+            )
         
         # Update last activity
-        self.sessions[session_key]["last_activity"] = datetime.now().isoformat()
-        self._save_sessions()
+        self.sessions[session_key].last_activity = now
+        self._save_session(session_key)
         
         return self.sessions[session_key]
     
@@ -122,39 +325,29 @@ class UserManager:
         """Add message to conversation history"""
         session = self.get_or_create_session(user_id, channel)
         
-        message = {
-            "role": role,  # "user" or "assistant"
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        session["messages"].append(message)
+        message = Message(role, content, int(time.time()))
         
-        # Keep only last 10 messages for context
-        if len(session["messages"]) > 10:
-            session["messages"] = session["messages"][-10:]
+        # Bounded deque, older messages drop off automatically
+        session.messages.append(message)
         
-        # Update context (last 5 exchanges)
-        session["context"] = session["messages"][-10:]
-        
-        self._save_sessions()
+        self._save_session(session.session_id)
         
         # Update user stats
         if user_id in self.users:
             self.users[user_id]["total_messages"] += 1
-            self._save_users()
+            self._save_user(user_id)
     
-    def get_conversation_context(self, user_id: str, channel: str = "whatsapp") -> List[Dict]:
+    def get_conversation_context(self, user_id: str, channel: str = "whatsapp") -> List[Message]:
         """Get recent conversation context"""
         session = self.get_or_create_session(user_id, channel)
-        return session.get("context", [])
+        return list(session.messages)
     
     def clear_session(self, user_id: str, channel: str = "whatsapp"):
         """Clear conversation session"""
         session_key = f"{user_id}_{channel}"
         if session_key in self.sessions:
             del self.sessions[session_key]
-            self._save_sessions()
+            self._sessions_journal.delete(session_key)
     
     def get_user_stats(self, user_id: str) -> Dict:
         """Get user statistics"""
@@ -162,26 +355,24 @@ class UserManager:
             return {}
         
         user = self.users[user_id]
-        collection = self.get_user_collection(user_id)
         
         return {
             "name": user["name"],
-            "created_at": user["created_at"],
+            "created_at": datetime.fromtimestamp(user["created_at"]).isoformat(),
             "total_messages": user["total_messages"],
-            "total_documents": collection.count(),
+            "total_documents": self.get_chunk_count(user_id),
             "member_since": self._days_since(user["created_at"])
         }
     
-    def _days_since(self, date_str: str) -> int:
-        """Calculate days since date"""
-        created = datetime.fromisoformat(date_str)
-        return (datetime.now() - created).days
+    def _days_since(self, timestamp: int) -> int:
+        """Calculate days since an epoch timestamp"""
+        return (int(time.time()) - timestamp) // 86400
     
     def increment_document_count(self, user_id: str):
         """Increment user's document count"""
         if user_id in self.users:
             self.users[user_id]["total_documents"] += 1
-            self._save_users()
+            self._save_user(user_id)
     
     def list_all_users(self) -> List[Dict]:
         """List all users (admin function)"""
@@ -192,15 +383,23 @@ class UserManager:
         # Delete user record
         if user_id in self.users:
             del self.users[user_id]
-            self._save_users()
+            self._users_journal.delete(user_id)
         
         # Delete sessions
         sessions_to_delete = [k for k in self.sessions.keys() if k.startswith(user_id)]
         for session_key in sessions_to_delete:
             del self.sessions[session_key]
-        self._save_sessions()
+            self._sessions_journal.delete(session_key)
+        
+        # Delete document metadata
+        documents_to_delete = [k for k in self.documents.keys() if k.startswith(user_id)]
+        for doc_id in documents_to_delete:
+            del self.documents[doc_id]
+            self._documents_journal.delete(doc_id)
         
         # Delete collection
+        self._collections.pop(user_id, None)
+        self._chunk_counts.pop(user_id, None)
         try:
             collection_name = f"user_{user_id}"
             self.chroma_client.delete_collection(name=collection_name)
@@ -3,27 +3,67 @@ User-Aware RAG System
 Each user has their own private knowledge base and conversation context
 """
 
-from rag_system import RAGSystem
+from rag_system import (
+    RAGSystem, get_llm_client, get_embedding_model, get_embedding_cache, truncate_to_tokens,
+    CHROMA_ADD_BATCH_SIZE, _chunk_id
+)
 from user_manager import UserManager
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any
-from openai import OpenAI
-from config import Config
+from semantic_cache import SemanticCache
+from typing import List, Dict, Any, Iterator, Iterable, Optional
+from functools import lru_cache
+from cachetools import TTLCache
+import numpy as np
+import uuid
+import threading
+from config import get_config
+
+# Messages of history included in the prompt (the last 3 exchanges)
+RECENT_MESSAGES = 6
+
+# Fixed part of the system prompt, kept first so every request shares the same prefix
+SYSTEM_PREAMBLE = """You are a helpful AI assistant with access to the user's private knowledge base.
+
+Guidelines:
+- Remember the conversation context and refer to it when relevant
+- Answer based on the knowledge base when available
+- If the answer isn't in the knowledge base, use your general knowledge
+- Be conversational and remember what the user said earlier
+- Keep responses concise and helpful"""
 
 class UserRAGSystem:
     def __init__(self):
-        self.config = Config()
+        self.config = get_config()
         self.user_manager = UserManager()
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Shared with RAGSystem; encode once so the first upload doesn't pay for lazy init
+        self.embedding_model = get_embedding_model()
+        dim = self._encode(["warmup"]).shape[1]
+        # Chunk embeddings are shared with RAGSystem, so text seen by any user is never re-encoded
+        self.embedding_cache = get_embedding_cache(self.config.EMBEDDING_CACHE_PATH)
         
-        # Initialize GPT-OSS client
-        self.gpt_client = OpenAI(
-            base_url="https://router.huggingface.co/v1",
-            api_key=self.config.HUGGINGFACE_API_TOKEN
-        )
+        # Memoize query embeddings, and search results per user until their documents change
+        self._embed_query = lru_cache(maxsize=1024)(self._encode_query)
+        self._search_cache = TTLCache(maxsize=2048, ttl=300)
+        self._search_cache_lock = threading.Lock()
+        self._user_versions = {}
+        self._conversation_epochs = {}
+        
+        # Answers reused for rephrased questions from the same user and knowledge base
+        self._answer_cache = SemanticCache(dim, ttl=self.config.RAG_CACHE_TTL)
     
     def add_document_for_user(self, user_id: str, text: str, metadata: Dict[str, Any] = None) -> str:
         """Add document to user's private knowledge base"""
+        return self.add_pages_for_user(user_id, [text], metadata)
+    
+    def has_document(self, user_id: str, content_hash: str) -> bool:
+        """Check whether a file with this content hash is already in the user's knowledge base"""
+        return bool(self.user_manager.get_document_metadata(f"{user_id}_{content_hash}"))
+    
+    def add_pages_for_user(self, user_id: str, pages: Iterable[str], metadata: Dict[str, Any] = None) -> str:
+        """Add a document to user's private knowledge base page by page
+        
+        Pages are chunked as they arrive and embedded in bounded batches, so only
+        one batch of chunks is held in memory at a time.
+        """
         if metadata is None:
             metadata = {}
         
@@ -32,39 +72,78 @@ class UserRAGSystem:
         # Get user's collection
         collection = self.user_manager.get_user_collection(user_id)
         
-        # Split text into chunks
-        chunks = self._split_text(text)
+        # Files without a name (e.g. chat uploads) are identified by their content hash;
+        # anything else (scraped pages, plain text) gets its own random ID
+        doc_key = metadata.get('filename') or metadata.get('content_hash') or uuid.uuid4().hex
+        doc_id = f"{user_id}_{doc_key}"
         
-        # Generate embeddings
-        embeddings = self.embedding_model.encode(chunks)
+        # Split pages into chunks and add them to the collection a batch at a time
+        added = 0
+        batch = []
+        for page in pages:
+            batch.extend(self._split_text(page))
+            while len(batch) >= CHROMA_ADD_BATCH_SIZE:
+                self._add_chunks(collection, doc_id, batch[:CHROMA_ADD_BATCH_SIZE], added)
+                added += CHROMA_ADD_BATCH_SIZE
+                batch = batch[CHROMA_ADD_BATCH_SIZE:]
+        if batch:
+            self._add_chunks(collection, doc_id, batch, added)
+            added += len(batch)
         
-        # Create unique IDs
-        doc_id = metadata.get('filename', 'doc')
-        chunk_ids = [f"{user_id}_{doc_id}_chunk_{i}" for i in range(len(chunks))]
+        if not added:
+            return "No text found in document"
         
-        # Add to user's collection
-        collection.add(
-            embeddings=embeddings.tolist(),
-            documents=chunks,
-            metadatas=[metadata] * len(chunks),
-            ids=chunk_ids
-        )
+        # Store document metadata once; chunks only reference it
+        self.user_manager.save_document_metadata(doc_id, metadata)
         
         # Update user stats
+        self.user_manager.add_chunk_count(user_id, added)
         self.user_manager.increment_document_count(user_id)
         
-        return f"Added {len(chunks)} chunks to your private knowledge base"
+        # Retire cached searches over the old collection
+        with self._search_cache_lock:
+            self._user_versions[user_id] = self._user_versions.get(user_id, 0) + 1
+        
+        return f"Added {added} chunks to your private knowledge base"
+    
+    def _add_chunks(self, collection, doc_id: str, chunks: List[str], start: int):
+        """Embed chunks and add them to a collection, numbering them from start"""
+        embeddings = self.embedding_cache.encode(chunks, self._encode)
+        indices = range(start, start + len(chunks))
+        collection.add(
+            embeddings=embeddings.tolist(),
+            documents=chunks,
+            metadatas=[{"doc_id": doc_id, "chunk_idx": i} for i in indices],
+            ids=[f"{doc_id}_chunk_{i}" for i in indices]
+        )
     
     def query_with_context(self, user_id: str, question: str, channel: str = "whatsapp") -> str:
         """Query with conversation context (like ChatGPT)"""
-        # Get conversation history
-        context = self.user_manager.get_conversation_context(user_id, channel)
-        
-        # Search user's private knowledge base
-        relevant_docs = self._search_user_documents(user_id, question)
+        # Cached answers only apply to the same knowledge base and the same conversation;
+        # every turn changes the history, so it is scoped by clear_conversation epochs only
+        with self._search_cache_lock:
+            scope = (
+                user_id,
+                channel,
+                self._user_versions.get(user_id, 0),
+                self._conversation_epochs.get((user_id, channel), 0)
+            )
+        query_embedding = np.asarray(self._embed_query(question), dtype=np.float32)
+        response = self._answer_cache.get(scope, query_embedding)
         
-        # Generate response with context
-        response = self._generate_contextual_response(question, relevant_docs, context)
+        if response is None:
+            # Get conversation history
+            context = self.user_manager.get_conversation_context(user_id, channel)
+            
+            # Search user's private knowledge base
+            relevant_docs = self._search_user_documents(user_id, question)
+            
+            # Generate response with context
+            response = self._generate_contextual_response(question, relevant_docs, context)
+            if response is None:
+                response = self._fallback_response(relevant_docs)
+            else:
+                self._answer_cache.put(scope, query_embedding, response)
         
         # Save to conversation history
         self.user_manager.add_message_to_session(user_id, "user", question, channel)
@@ -74,102 +153,150 @@ class UserRAGSystem:
     
     def _search_user_documents(self, user_id: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """Search in user's private knowledge base"""
+        with self._search_cache_lock:
+            cache_key = (user_id, " ".join(query.lower().split()), top_k, self._user_versions.get(user_id, 0))
+            cached = self._search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            collection = self.user_manager.get_user_collection(user_id)
-            
             # Check if collection has documents
-            if collection.count() == 0:
+            count = self.user_manager.get_chunk_count(user_id)
+            if count == 0:
                 return []
             
+            collection = self.user_manager.get_user_collection(user_id)
+            
             # Generate query embedding
-            query_embedding = self.embedding_model.encode([query])
+            query_embedding = self._embed_query(query)
             
             # Search
             results = collection.query(
-                query_embeddings=query_embedding.tolist(),
-                n_results=min(top_k, collection.count())
+                query_embeddings=[list(query_embedding)],
+                n_results=min(top_k, count)
             )
             
             # Format results
             formatted_results = []
             if results['documents'] and results['documents'][0]:
                 for i, doc in enumerate(results['documents'][0]):
+                    metadata = results['metadatas'][0][i] if results['metadatas'][0] else {}
+                    if "doc_id" in metadata:
+                        metadata = {**self.user_manager.get_document_metadata(metadata["doc_id"]), **metadata}
                     formatted_results.append({
                         'content': doc,
-                        'metadata': results['metadatas'][0][i] if results['metadatas'][0] else {},
+                        'metadata': metadata,
                         'distance': results['distances'][0][i] if results['distances'][0] else 0
                     })
             
+            with self._search_cache_lock:
+                self._search_cache[cache_key] = formatted_results
             return formatted_results
             
         except Exception as e:
             print(f"Error searching user documents: {str(e)}")
             return []
     
-    def _generate_contextual_response(self, question: str, docs: List[Dict], conversation_history: List[Dict]) -> str:
-        """Generate response with conversation context"""
-        # Prepare knowledge base context
-        kb_context = "\n\n".join([doc['content'] for doc in docs]) if docs else "No relevant documents found."
+    def _generate_contextual_response(self, question: str, docs: List[Dict], conversation_history: List[Dict]) -> Optional[str]:
+        """Generate response with conversation context, or None if the model fails"""
+        try:
+            content = "".join(self._stream_contextual_response(question, docs, conversation_history))
+            if content.strip():
+                return content.strip()
+            
+            raise Exception("Empty response from GPT-OSS")
+            
+        except Exception as e:
+            print(f"GPT-OSS error: {str(e)}")
+            return None
+    
+    def _fallback_response(self, docs: List[Dict]) -> str:
+        """Answer without the model, from the best matching document if any"""
+        if docs:
+            return f"Based on your knowledge base:\n\n{docs[0]['content'][:500]}..."
+        else:
+            return "I don't have enough information in your knowledge base to answer that question. Try uploading relevant documents!"
+    
+    def _stream_contextual_response(self, question: str, docs: List[Dict], conversation_history: List[Dict]) -> Iterator[str]:
+        """Stream response text with conversation context as the model produces it"""
+        # Prepare knowledge base context, splitting the token budget across documents.
+        # Chunks go in a fixed order so the same retrieved set always yields the same prompt prefix
+        if docs:
+            per_doc = self.config.CONTEXT_MAX_TOKENS // len(docs)
+            ordered = sorted(docs, key=lambda doc: _chunk_id(doc['content']))
+            kb_context = "\n\n".join(truncate_to_tokens(doc['content'], per_doc) for doc in ordered)
+        else:
+            kb_context = "No relevant documents found."
         
         # Prepare conversation context
         conv_context = ""
         if conversation_history:
-            recent_messages = conversation_history[-6:]  # Last 3 exchanges
+            recent_messages = conversation_history[-RECENT_MESSAGES:]
             conv_context = "\n".join([
-                f"{msg['role'].capitalize()}: {msg['content']}"
+                f"{msg.role.capitalize()}: {msg.content}"
                 for msg in recent_messages
             ])
         
-        # Create system prompt
-        system_prompt = f"""You are a helpful AI assistant with access to the user's private knowledge base.
-
-Previous conversation:
-{conv_context if conv_context else "This is the start of the conversation."}
+        # Create system prompt: static instructions, then documents, then the changing conversation
+        system_prompt = f"""{SYSTEM_PREAMBLE}
 
 Knowledge base context:
-{kb_context[:2000]}
+{kb_context}
 
-Guidelines:
-- Remember the conversation context and refer to it when relevant
-- Answer based on the knowledge base when available
-- If the answer isn't in the knowledge base, use your general knowledge
-- Be conversational and remember what the user said earlier
-- Keep responses concise and helpful"""
+Previous conversation:
+{conv_context if conv_context else "This is the start of the conversation."}"""
 
-        try:
-            response = self.gpt_client.chat.completions.create(
-                model="openai/gpt-oss-20b:fireworks-ai",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": question}
-                ],
-                max_tokens=300,
-                temperature=0.7
-            )
-            
-            if response.choices and response.choices[0].message:
-                content = response.choices[0].message.content
-                if content and content.strip():
-                    return content.strip()
-            
-            raise Exception("Empty response from GPT-OSS")
-            
-        except Exception as e:
-            print(f"GPT-OSS error: {str(e)}")
-            # Fallback response
-            if docs:
-                return f"Based on your knowledge base:\n\n{docs[0]['content'][:500]}..."
-            else:
-                return "I don't have enough information in your knowledge base to answer that question. Try uploading relevant documents!"
+        stream = get_llm_client().chat.completions.create(
+            model="openai/gpt-oss-20b:fireworks-ai",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": question}
+            ],
+            max_tokens=300,
+            temperature=0.7,
+            stream=True
+        )
+        
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     
-    def _split_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-        """Split text into chunks"""
-        words = text.split()
-        chunks = []
+    def _encode_query(self, query: str) -> tuple:
+        """Embed a single query as a hashable tuple"""
+        return tuple(self._encode([query])[0].tolist())
+    
+    def _encode(self, texts: List[str]):
+        """Embed texts in batches as normalized float32 vectors"""
+        return self.embedding_model.encode(
+            texts,
+            batch_size=self.config.EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+    
+    def _split_text(self, text: str, chunk_tokens: int = 254, overlap: int = 32) -> List[str]:
+        """Split text into windows of at most chunk_tokens embedding-model tokens
+        
+        The default leaves room for [CLS] and [SEP] within MiniLM's 256-token limit.
+        Chunks are sliced from the original text via token offsets, so case and
+        spacing are preserved.
+        """
+        offsets = self.embedding_model.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            verbose=False
+        )["offset_mapping"]
         
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = " ".join(words[i:i + chunk_size])
-            chunks.append(chunk)
+        chunks = []
+        stride = max(1, chunk_tokens - overlap)
+        for start in range(0, len(offsets), stride):
+            end = min(start + chunk_tokens, len(offsets)) - 1
+            chunks.append(text[offsets[start][0]:offsets[end][1]])
+            if end == len(offsets) - 1:
+                break
         
         return chunks
     
@@ -179,4 +306,9 @@ Guidelines:
     
     def clear_conversation(self, user_id: str, channel: str = "whatsapp"):
         """Clear conversation history"""
-        self.user_manager.clear_session(user_id, channel)
\ No newline at end of file
+        self.user_manager.clear_session(user_id, channel)
+        
+        # Retire answers cached during the old conversation
+        with self._search_cache_lock:
+            key = (user_id, channel)
+            self._conversation_epochs[key] = self._conversation_epochs.get(key, 0) + 1
\ No newline at end of file
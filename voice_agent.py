@@ -5,29 +5,81 @@ Integrates with RAG system for intelligent voice responses
 
 from fastapi import WebSocket
 from twilio.twiml.voice_response import VoiceResponse, Gather, Say
-from rag_system import RAGSystem
+from rag_system import RAGSystem, get_rag_system
+from config import get_config
 import logging
 import json
 import asyncio
+import re
+from xml.sax.saxutils import escape
+from functools import lru_cache
 from typing import Optional
 
+# Fixed phrases of the call flow; with VOICE_PROMPTS_URL set, <key>.mp3 recordings are played instead
+CANNED_PROMPTS = {
+    "greeting": (
+        "Hello! Welcome to the RAG Bot voice assistant. "
+        "I can answer questions based on my knowledge base. "
+        "Please ask your question after the beep."
+    ),
+    "no_input": "I didn't hear anything. Please call back if you have a question. Goodbye!",
+    "not_caught": "I'm sorry, I didn't catch that. Please try again.",
+    "another": "Would you like to ask another question? Say yes or no.",
+    "goodbye": "Thank you for using RAG Bot. Goodbye!",
+    "error": "I'm sorry, I encountered an error processing your question. Please try again later.",
+    "next": "Great! Please ask your next question.",
+    "farewell": "Thank you for using RAG Bot. Have a great day! Goodbye!"
+}
+
+# Replies to "another question?" (Twilio transcripts carry punctuation, e.g. "Yes.")
+_WORD_RE = re.compile(r"[a-z']+")
+_AFFIRM = frozenset({'yes', 'yeah', 'yep', 'sure', 'another', 'ok', 'okay'})
+_NEG = frozenset({'no', 'nope', 'nah'})
+
+# Stands in for the spoken answer in the cached answer TwiML
+_ANSWER_SLOT = "__ANSWER__"
+
+# Longest answer read out on a call, in characters
+SPEECH_MAX_CHARS = 500
+
+# Markdown characters dropped before speaking
+_MD_TRANS = str.maketrans('', '', '*_`')
+# Emojis and other characters the speech engine shouldn't read out
+_SPEECH_STRIP = re.compile(r'[^\w\s.,!?-]')
+
 class VoiceAgent:
-    def __init__(self):
-        self.rag_system = RAGSystem()
+    def __init__(self, rag_system: RAGSystem = None):
+        self.rag_system = rag_system or get_rag_system()
         self.active_calls = {}
+        self.prompts_url = (get_config().VOICE_PROMPTS_URL or "").rstrip("/")
+        
+        # Every response except the answer text is fixed, so serialize them once.
+        # Streaming wouldn't help: Twilio acts on a TwiML document only once it has
+        # all of it, and these are a few hundred bytes.
+        self._incoming_twiml = self._build_incoming()
+        self._answer_twiml = self._build_answer(_ANSWER_SLOT)
+        self._not_caught_twiml = self._build_not_caught()
+        self._error_twiml = self._build_error()
+        self._next_twiml = self._build_next()
+        self._farewell_twiml = self._build_farewell()
+    
+    def _prompt(self, verb, key: str):
+        """Add a canned prompt to a TwiML verb, as a recording when available"""
+        if self.prompts_url:
+            verb.play(f"{self.prompts_url}/{key}.mp3")
+        else:
+            verb.say(CANNED_PROMPTS[key], voice='Polly.Joanna', language='en-US')
         
     def handle_incoming_call(self, from_number: str) -> str:
         """Handle incoming voice call - return TwiML"""
+        return self._incoming_twiml
+    
+    def _build_incoming(self) -> str:
+        """Serialize the greeting TwiML"""
         response = VoiceResponse()
         
         # Greet the caller
-        response.say(
-            "Hello! Welcome to the RAG Bot voice assistant. "
-            "I can answer questions based on my knowledge base. "
-            "Please ask your question after the beep.",
-            voice='Polly.Joanna',
-            language='en-US'
-        )
+        self._prompt(response, "greeting")
         
         # Gather speech input
         gather = Gather(
@@ -41,106 +93,115 @@ class VoiceAgent:
         response.append(gather)
         
         # If no input, say goodbye
-        response.say(
-            "I didn't hear anything. Please call back if you have a question. Goodbye!",
-            voice='Polly.Joanna'
-        )
+        self._prompt(response, "no_input")
         
         return str(response)
     
     def process_speech(self, speech_result: str, call_sid: str) -> str:
         """Process speech input and return TwiML response"""
-        response = VoiceResponse()
-        
         if not speech_result:
-            response.say(
-                "I'm sorry, I didn't catch that. Please try again.",
-                voice='Polly.Joanna'
-            )
-            response.redirect('/voice/webhook')
-            return str(response)
+            return self._not_caught_twiml
         
         # Query the RAG system
         try:
-            answer = self.rag_system.query(speech_result)
+            # Stop generating once there is more than can be spoken
+            answer = "".join(self.rag_system.stream_query(speech_result, max_chars=SPEECH_MAX_CHARS))
             
             # Clean up answer for speech (remove markdown, emojis, etc.)
             clean_answer = self._clean_for_speech(answer)
             
-            # Speak the answer
-            response.say(
-                clean_answer,
-                voice='Polly.Joanna',
-                language='en-US'
-            )
-            
-            # Ask if they want to ask another question
-            gather = Gather(
-                input='speech',
-                action='/voice/process',
-                method='POST',
-                speech_timeout='auto',
-                language='en-US',
-                hints='yes, no, another question'
-            )
-            
-            gather.say(
-                "Would you like to ask another question? Say yes or no.",
-                voice='Polly.Joanna'
-            )
-            
-            response.append(gather)
-            
-            # If no response, end call
-            response.say("Thank you for using RAG Bot. Goodbye!", voice='Polly.Joanna')
-            response.hangup()
+            return self._answer_twiml.replace(_ANSWER_SLOT, escape(clean_answer), 1)
             
         except Exception as e:
-            logging.error(f"Error processing speech: {str(e)}")
-            response.say(
-                "I'm sorry, I encountered an error processing your question. Please try again later.",
-                voice='Polly.Joanna'
-            )
-            response.hangup()
+            logging.error("Error processing speech: %s", e)
+            return self._error_twiml
+    
+    def _build_not_caught(self) -> str:
+        """Serialize the TwiML asking the caller to repeat themselves"""
+        response = VoiceResponse()
+        self._prompt(response, "not_caught")
+        response.redirect('/voice/webhook')
+        return str(response)
+    
+    def _build_answer(self, answer: str) -> str:
+        """Serialize the TwiML speaking an answer and offering another question"""
+        response = VoiceResponse()
+        
+        # Speak the answer
+        response.say(
+            answer,
+            voice='Polly.Joanna',
+            language='en-US'
+        )
+        
+        # Ask if they want to ask another question
+        gather = Gather(
+            input='speech',
+            action='/voice/process',
+            method='POST',
+            speech_timeout='auto',
+            language='en-US',
+            hints='yes, no, another question'
+        )
+        
+        self._prompt(gather, "another")
+        
+        response.append(gather)
         
+        # If no response, end call
+        self._prompt(response, "goodbye")
+        response.hangup()
+        
+        return str(response)
+    
+    def _build_error(self) -> str:
+        """Serialize the TwiML ending a call after a failure"""
+        response = VoiceResponse()
+        self._prompt(response, "error")
+        response.hangup()
         return str(response)
     
     def handle_continue(self, speech_result: str) -> str:
         """Handle continuation decision"""
-        response = VoiceResponse()
-        
-        speech_lower = speech_result.lower() if speech_result else ""
+        words = set(_WORD_RE.findall(speech_result.lower())) if speech_result else set()
         
-        if any(word in speech_lower for word in ['yes', 'yeah', 'sure', 'another']):
+        if words & _AFFIRM and not words & _NEG:
             # Continue to another question
-            response.say(
-                "Great! Please ask your next question.",
-                voice='Polly.Joanna'
-            )
-            response.redirect('/voice/webhook')
+            return self._next_twiml
         else:
             # End the call
-            response.say(
-                "Thank you for using RAG Bot. Have a great day! Goodbye!",
-                voice='Polly.Joanna'
-            )
-            response.hangup()
-        
+            return self._farewell_twiml
+    
+    def _build_next(self) -> str:
+        """Serialize the TwiML returning to the question prompt"""
+        response = VoiceResponse()
+        self._prompt(response, "next")
+        response.redirect('/voice/webhook')
+        return str(response)
+    
+    def _build_farewell(self) -> str:
+        """Serialize the TwiML ending the call"""
+        response = VoiceResponse()
+        self._prompt(response, "farewell")
+        response.hangup()
         return str(response)
     
-    def _clean_for_speech(self, text: str) -> str:
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _clean_for_speech(text: str) -> str:
         """Clean text for speech synthesis"""
         # Remove markdown
-        text = text.replace('**', '').replace('*', '')
-        text = text.replace('_', '').replace('`', '')
+        text = text.translate(_MD_TRANS)
+        
+        # Only clean what can be spoken, with headroom for stripped characters
+        text = text[:SPEECH_MAX_CHARS + 100]
         
         # Remove emojis and special characters
-        import re
-        text = re.sub(r'[^\w\s.,!?-]', '', text)
+        text = _SPEECH_STRIP.sub('', text)
         
-        # Limit length for speech (max ~500 chars)
-        if len(text) > 500:
-            text = text[:497] + "..."
+        # Limit length for speech
+        if len(text) > SPEECH_MAX_CHARS:
+            text = text[:SPEECH_MAX_CHARS - 3] + "..."
         
         return text
     
@@ -154,8 +215,8 @@ class VoiceAgentRealtime:
     Advanced voice agent using OpenAI Realtime API
     For more natural conversations with streaming audio
     """
-    def __init__(self):
-        self.rag_system = RAGSystem()
+    def __init__(self, rag_system: RAGSystem = None):
+        self.rag_system = rag_system or get_rag_system()
         self.active_sessions = {}
     
     async def handle_websocket(self, websocket: WebSocket, call_sid: str):
@@ -180,11 +241,11 @@ class VoiceAgentRealtime:
                     await self._process_audio_chunk(websocket, data, call_sid)
                 
                 elif data.get("event") == "stop":
-                    logging.info(f"Call {call_sid} ended")
+                    logging.info("Call %s ended", call_sid)
                     break
                     
         except Exception as e:
-            logging.error(f"WebSocket error: {str(e)}")
+            logging.error("WebSocket error: %s", e)
         finally:
             if call_sid in self.active_sessions:
                 del self.active_sessions[call_sid]
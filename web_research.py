@@ -1,51 +1,125 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests_cache import CachedSession
+from requests_cache.backends.sqlite import SQLiteDict
 from bs4 import BeautifulSoup
 import logging
-from typing import List, Dict, Any
-from rag_system import RAGSystem
+from typing import List, Dict, Any, Optional, Tuple
+from rag_system import RAGSystem, get_rag_system
+from config import get_config
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
 import time
+import re
+import orjson
+
+# Largest page body parsed when scraping, in bytes
+SCRAPE_MAX_BYTES = 2 * 1024 * 1024
+
+_WS_RE = re.compile(r'\s+')
 
 class WebResearcher:
-    def __init__(self):
-        self.rag_system = RAGSystem()
+    def __init__(self, rag_system: RAGSystem = None):
+        self.rag_system = rag_system or get_rag_system()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        
+        # Pooled keep-alive session shared by all outbound research requests,
+        # with successful GETs cached on disk so repeat lookups skip the network
+        config = get_config()
+        self.timeout = config.WEB_CLIENT_TIMEOUT_MS / 1000
+        self.session = CachedSession(
+            config.WEB_CACHE_PATH,
+            backend='sqlite',
+            expire_after=config.WEB_CACHE_TTL,
+            allowable_codes=(200,),
+            allowable_methods=('GET',),
+            cache_control=True,
+            stale_if_error=True
+        )
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=64,
+            max_retries=Retry(total=config.WEB_RETRIES, backoff_factor=0.2)
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        # Scraped pages bypass the HTTP cache, which would read whole bodies before the
+        # type and size checks; their parsed text is cached in the same file instead
+        self.page_session = requests.Session()
+        self.page_session.headers.update(self.headers)
+        self.page_session.mount('https://', adapter)
+        self.page_session.mount('http://', adapter)
+        self.page_ttl = config.WEB_CACHE_TTL
+        self._pages = SQLiteDict(config.WEB_CACHE_PATH, table_name='scraped_pages', serializer=None)
     
-    def scrape_url(self, url: str) -> Dict[str, Any]:
-        """Scrape content from a URL"""
+    def _cached_page(self, url: str, max_age: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Return a previously scraped page no older than max_age seconds (any age if None)"""
         try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
+            entry = orjson.loads(self._pages[url])
+        except KeyError:
+            return None
+        if max_age is not None and time.time() - entry["fetched_at"] > max_age:
+            return None
+        return entry["page"]
+    
+    def scrape_url(self, url: str, force_refresh: bool = False) -> Dict[str, Any]:
+        """Scrape content from a URL, reusing a cached copy unless force_refresh is set"""
+        if not force_refresh:
+            cached = self._cached_page(url, self.page_ttl)
+            if cached:
+                return cached
+        
+        try:
+            with self.page_session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                
+                # Only parse HTML, and stop downloading once the size cap is reached
+                content_type = response.headers.get('Content-Type', '')
+                if content_type and 'html' not in content_type:
+                    return {
+                        "success": False,
+                        "url": url,
+                        "error": f"Unsupported content type: {content_type}"
+                    }
+                body = bytearray()
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    body += chunk
+                    if len(body) >= SCRAPE_MAX_BYTES:
+                        break
             
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(bytes(body[:SCRAPE_MAX_BYTES]), 'lxml')
             
             # Remove script and style elements
             for script in soup(["script", "style", "nav", "footer", "header"]):
                 script.decompose()
             
-            # Get text content
-            text = soup.get_text()
-            
-            # Clean up text
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
+            # Get text content with whitespace collapsed
+            text = _WS_RE.sub(' ', soup.get_text(' ')).strip()
             
             # Get title
             title = soup.title.string if soup.title else urlparse(url).netloc
             
-            return {
+            page = {
                 "success": True,
                 "url": url,
-                "title": title,
+                "title": str(title) if title is not None else None,
                 "content": text[:10000],  # Limit to 10k chars
                 "length": len(text)
             }
+            self._pages[url] = orjson.dumps({"fetched_at": time.time(), "page": page})
+            return page
             
         except Exception as e:
-            logging.error(f"Error scraping {url}: {str(e)}")
+            logging.error("Error scraping %s: %s", url, e)
+            # Serve a stale copy rather than nothing
+            stale = self._cached_page(url, None)
+            if stale:
+                return stale
             return {
                 "success": False,
                 "url": url,
@@ -60,60 +134,43 @@ class WebResearcher:
             return f"Failed to scrape {url}: {result['error']}"
         
         # Add to RAG system
-        metadata = {
+        add_result = self.rag_system.add_document(result["content"], self._web_metadata(result))
+        
+        return f"✅ Added content from {result['title']}\n{add_result}\nSource: {url}"
+    
+    def _web_metadata(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        """Metadata stored with a scraped page"""
+        return {
             "source": "web",
-            "url": url,
-            "title": result["title"],
+            "url": page["url"],
+            "title": page["title"],
             "scraped_at": time.strftime("%Y-%m-%d %H:%M:%S")
         }
-        
-        add_result = self.rag_system.add_document(result["content"], metadata)
-        
-        return f"✅ Added content from {result['title']}\n{add_result}\nSource: {url}"
     
     def research_topic(self, topic: str, num_sources: int = 3) -> str:
         """Research a topic using multiple sources and add to knowledge base"""
-        results = []
+        # Query DuckDuckGo and Wikipedia (always tried, it's most reliable) concurrently
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            ddg_future = pool.submit(self._search_duckduckgo, topic, num_sources)
+            wiki_future = pool.submit(self._search_wikipedia, topic)
         
-        # Try DuckDuckGo first
-        try:
-            search_url = f"https://api.duckduckgo.com/?q={topic}&format=json"
-            response = requests.get(search_url, timeout=10)
-            data = response.json()
-            
-            # Get abstract if available
-            if data.get('Abstract'):
-                metadata = {
-                    "source": "duckduckgo",
-                    "topic": topic,
-                    "type": "abstract"
-                }
-                self.rag_system.add_document(data['Abstract'], metadata)
-                results.append(f"✅ Added DuckDuckGo abstract")
-            
-            # Get related topics
-            if data.get('RelatedTopics'):
-                for item in data['RelatedTopics'][:num_sources]:
-                    if isinstance(item, dict) and item.get('Text'):
-                        metadata = {
-                            "source": "duckduckgo",
-                            "topic": topic,
-                            "type": "related"
-                        }
-                        self.rag_system.add_document(item['Text'], metadata)
-                        results.append(f"✅ Added related info")
-        except Exception as e:
-            logging.error(f"DuckDuckGo error: {str(e)}")
+        # Documents found across sources, added in one batch at the end
+        texts, metadatas, results = ddg_future.result()
         
-        # Always try Wikipedia as it's most reliable
         try:
-            wiki_result = self._search_wikipedia(topic)
+            wiki_result = wiki_future.result()
             if wiki_result:
-                results.append(wiki_result)
+                extract, metadata = wiki_result
+                texts.append(extract)
+                metadatas.append(metadata)
+                results.append(f"✅ Added Wikipedia: '{metadata['title']}'")
         except Exception as e:
-            logging.error(f"Wikipedia error: {str(e)}")
+            logging.error("Wikipedia error: %s", e)
             print(f"Wikipedia error: {str(e)}")
         
+        if texts:
+            self.rag_system.add_documents(texts, metadatas)
+        
         # If still no results, try web search
         if not results:
             try:
@@ -121,7 +178,7 @@ class WebResearcher:
                 if web_result:
                     results.append(web_result)
             except Exception as e:
-                logging.error(f"Web search error: {str(e)}")
+                logging.error("Web search error: %s", e)
                 print(f"Web search error: {str(e)}")
         
         if results:
@@ -129,46 +186,72 @@ class WebResearcher:
         else:
             return f"❌ No results found for '{topic}'. Try using 'scrape <url>' with a specific article URL."
     
-    def _search_wikipedia(self, topic: str) -> str:
-        """Search Wikipedia and add content"""
+    def _search_duckduckgo(self, topic: str, num_sources: int) -> Tuple[List[str], List[Dict[str, Any]], List[str]]:
+        """Search DuckDuckGo and return documents, their metadata and result lines"""
+        results = []
+        texts = []
+        metadatas = []
+        
+        try:
+            search_url = f"https://api.duckduckgo.com/?q={topic}&format=json"
+            response = self.session.get(search_url, timeout=self.timeout)
+            data = response.json()
+            
+            # Get abstract if available
+            if data.get('Abstract'):
+                metadata = {
+                    "source": "duckduckgo",
+                    "topic": topic,
+                    "type": "abstract"
+                }
+                texts.append(data['Abstract'])
+                metadatas.append(metadata)
+                results.append(f"✅ Added DuckDuckGo abstract")
+            
+            # Get related topics; they share one metadata dict
+            related = [
+                item['Text'] for item in data.get('RelatedTopics', [])[:num_sources]
+                if isinstance(item, dict) and item.get('Text')
+            ]
+            if related:
+                metadata = {
+                    "source": "duckduckgo",
+                    "topic": topic,
+                    "type": "related"
+                }
+                texts.extend(related)
+                metadatas.extend([metadata] * len(related))
+                results.extend(["✅ Added related info"] * len(related))
+        except Exception as e:
+            logging.error("DuckDuckGo error: %s", e)
+        
+        return texts, metadatas, results
+    
+    def _search_wikipedia(self, topic: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Search Wikipedia and return the top article's extract and metadata"""
         try:
-            # Wikipedia API search
+            # Search and fetch the top page's plain-text extract in one request
             search_url = "https://en.wikipedia.org/w/api.php"
             params = {
                 "action": "query",
                 "format": "json",
-                "list": "search",
-                "srsearch": topic,
-                "srlimit": 1
+                "generator": "search",
+                "gsrsearch": topic,
+                "gsrlimit": 1,
+                "prop": "extracts",
+                "explaintext": 1,
+                "exsectionformat": "plain",
+                "exlimit": 1
             }
             
-            response = requests.get(search_url, params=params, timeout=10, headers=self.headers)
+            response = self.session.get(search_url, params=params, timeout=self.timeout)
             response.raise_for_status()
             data = response.json()
             
-            search_results = data.get('query', {}).get('search', [])
-            if not search_results:
-                return None
-            
-            page_title = search_results[0]['title']
-            
-            # Get page content with more text
-            content_params = {
-                "action": "query",
-                "format": "json",
-                "titles": page_title,
-                "prop": "extracts",
-                "explaintext": True,
-                "exsectionformat": "plain"
-            }
-            
-            content_response = requests.get(search_url, params=content_params, timeout=10, headers=self.headers)
-            content_response.raise_for_status()
-            content_data = content_response.json()
-            
-            pages = content_data.get('query', {}).get('pages', {})
+            pages = data.get('query', {}).get('pages', {})
             for page_id, page_data in pages.items():
                 if page_id != '-1' and 'extract' in page_data and page_data['extract']:
+                    page_title = page_data['title']
                     extract = page_data['extract'][:5000]  # Limit to 5k chars
                     metadata = {
                         "source": "wikipedia",
@@ -176,13 +259,12 @@ class WebResearcher:
                         "title": page_title,
                         "url": f"https://en.wikipedia.org/wiki/{page_title.replace(' ', '_')}"
                     }
-                    self.rag_system.add_document(extract, metadata)
-                    return f"✅ Added Wikipedia: '{page_title}'"
+                    return extract, metadata
             
             return None
             
         except Exception as e:
-            logging.error(f"Wikipedia search error: {str(e)}")
+            logging.error("Wikipedia search error: %s", e)
             print(f"Wikipedia error: {str(e)}")  # Debug print
             return None
     
@@ -218,17 +300,49 @@ class WebResearcher:
             return None
             
         except Exception as e:
-            logging.error(f"Web search error: {str(e)}")
+            logging.error("Web search error: %s", e)
             print(f"Web search error: {str(e)}")  # Debug print
             return None
     
     def scrape_multiple_urls(self, urls: List[str]) -> List[Dict[str, Any]]:
-        """Scrape multiple URLs and add to knowledge base"""
-        results = []
+        """Scrape multiple URLs and add to knowledge base
+        
+        Different hosts are scraped in parallel; URLs on the same host still go
+        one at a time with a pause in between.
+        """
+        by_host = {}
+        for url in urls:
+            by_host.setdefault(urlparse(url).netloc, []).append(url)
         
+        def scrape_host(host_urls: List[str]) -> Dict[str, Dict[str, Any]]:
+            host_results = {}
+            for i, url in enumerate(host_urls):
+                if i:
+                    time.sleep(1)  # Be polite, don't hammer servers
+                host_results[url] = self.scrape_url(url)
+            return host_results
+        
+        scraped = {}
+        if by_host:
+            with ThreadPoolExecutor(max_workers=min(8, len(by_host))) as pool:
+                for host_results in pool.map(scrape_host, by_host.values()):
+                    scraped.update(host_results)
+        
+        # Add every successful page in one batch
+        pages = [page for page in scraped.values() if page["success"]]
+        if pages:
+            self.rag_system.add_documents(
+                [page["content"] for page in pages],
+                [self._web_metadata(page) for page in pages]
+            )
+        
+        results = []
         for url in urls:
-            result = self.add_url_to_knowledge_base(url)
+            page = scraped[url]
+            if page["success"]:
+                result = f"✅ Added content from {page['title']}\nSource: {url}"
+            else:
+                result = f"Failed to scrape {url}: {page['error']}"
             results.append({"url": url, "result": result})
-            time.sleep(1)  # Be polite, don't hammer servers
         
         return results
\ No newline at end of file
@@ -1,20 +1,100 @@
 from twilio.rest import Client
 from twilio.twiml.messaging_response import MessagingResponse
-from rag_system import RAGSystem
+from rag_system import RAGSystem, get_rag_system, run_rag_job
+from pdf_extract import iter_pdf_pages
 from user_rag_system import UserRAGSystem
-from user_manager import UserManager
-from config import Config
+from web_research import WebResearcher
+from config import get_config
 import logging
+import hashlib
+import threading
+import re
 import requests
-import PyPDF2
-import io
+from concurrent.futures import ThreadPoolExecutor
+
+WELCOME_TEMPLATE = """
+🤖 *Welcome back, {name}!*
+
+I'm your personal RAG Bot with conversation memory!
+
+✨ *What I can do:*
+• Remember our conversation (like ChatGPT)
+• Answer questions from YOUR private knowledge base
+• Accept file uploads (PDFs, text files)
+• Research topics and learn from the web
+
+📤 *Upload files:* Just send me a PDF or text file!
+💬 *Ask anything:* I'll remember our conversation context
+
+Type 'help' for commands!
+        """
+
+HELP_TEXT = """
+🤖 *RAG Bot Help*
+
+*Commands:*
+• hello/hi - Get welcome message
+• help/? - Show this help
+• stats - Show YOUR personal statistics
+• clear - Clear conversation history
+• research <topic> - Research and add to YOUR knowledge base
+• scrape <url> - Add website content to YOUR knowledge base
+
+*File Uploads:*
+📤 Just send me a PDF or text file - I'll add it to YOUR private knowledge base!
+
+*Conversation:*
+💬 I remember our conversation context (like ChatGPT)
+🔒 Your data is private and isolated from other users
+
+*Examples:*
+• "What did we talk about earlier?"
+• "Tell me more about that"
+• Send a PDF → Ask questions about it
+• "research healthy diets"
+
+I'll remember our conversation and search YOUR private knowledge base!
+        """
+
+STATS_TEMPLATE = """
+📊 *Your Personal Stats*
+
+👤 Name: {name}
+📅 Member since: {member_since} days ago
+💬 Total messages: {total_messages}
+📚 Documents in your KB: {total_documents}
+
+Your knowledge base is private and secure! 🔒
+            """
+
+CLEARED_TEXT = "✅ Conversation history cleared! Starting fresh."
+ERROR_TEXT = "Sorry, I encountered an error processing your message. Please try again."
+DUPLICATE_TEXT = "📎 You've already uploaded this file - it's in your knowledge base!"
+PROCESSING_TEXT = "⏳ Processing your file - I'll message you when it's ready."
+BUSY_TEXT = "⏳ I'm busy processing other files right now. Please try again in a few minutes."
+
+def _build_twiml(text: str) -> str:
+    """Serialize a single-message TwiML response"""
+    resp = MessagingResponse()
+    resp.message(text)
+    return str(resp)
+
+# TwiML for replies that never change, serialized once; answers and per-user replies are built as needed
+_STATIC_TWIML = {
+    text: _build_twiml(text)
+    for text in (HELP_TEXT, CLEARED_TEXT, ERROR_TEXT, DUPLICATE_TEXT, PROCESSING_TEXT, BUSY_TEXT)
+}
 
 class WhatsAppBot:
-    def __init__(self):
-        self.config = Config()
-        self.rag_system = RAGSystem()
+    def __init__(self, rag_system: RAGSystem = None, researcher: WebResearcher = None):
+        self.config = get_config()
+        self.rag_system = rag_system or get_rag_system()
         self.user_rag_system = UserRAGSystem()
-        self.user_manager = UserManager()
+        # Share one UserManager so only one writer owns the user/session journals
+        self.user_manager = self.user_rag_system.user_manager
+        # One researcher so research/scrape commands reuse its pooled, cached HTTP session;
+        # pass the app's so both share a single handle on the web cache
+        self._researcher = researcher or WebResearcher(rag_system=self.rag_system)
         
         # Initialize Twilio client
         if self.config.TWILIO_ACCOUNT_SID and self.config.TWILIO_AUTH_TOKEN:
@@ -25,6 +105,16 @@ class WhatsAppBot:
         else:
             self.twilio_client = None
             logging.warning("Twilio credentials not configured")
+        
+        # Keep-alive session for media downloads; Twilio media URLs need HTTP Basic auth
+        self._http = requests.Session()
+        if self.config.TWILIO_ACCOUNT_SID and self.config.TWILIO_AUTH_TOKEN:
+            self._http.auth = (self.config.TWILIO_ACCOUNT_SID, self.config.TWILIO_AUTH_TOKEN)
+        
+        # Uploads are indexed one at a time off the webhook path; each pending job
+        # holds its file in memory, so only MAX_PENDING_INGESTS are accepted at once
+        self._ingest_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        self._ingest_slots = threading.BoundedSemaphore(self.config.MAX_PENDING_INGESTS)
     
     def handle_message(self, from_number: str, message_body: str, media_url: str = None, media_type: str = None) -> str:
         """Handle incoming WhatsApp message with optional media"""
@@ -35,163 +125,154 @@ class WhatsAppBot:
             
             # Handle media (file uploads)
             if media_url:
-                return self._handle_media_upload(user_id, media_url, media_type)
+                return self._handle_media_upload(from_number, user_id, media_url, media_type)
             
-            message_body_lower = message_body.strip().lower()
+            # Handle special commands; ordinary messages fail the match within a few characters
+            match = self._CMD_RE.match(message_body)
+            if match:
+                # Unicode case folding also matches look-alikes such as "ſtats", which aren't commands
+                command, arg_command, argument = match.groups()
+                if command and command.lower() in self._COMMANDS:
+                    return self._COMMANDS[command.lower()](self, user)
+                if arg_command and arg_command.lower() in self._ARG_COMMANDS:
+                    return self._ARG_COMMANDS[arg_command.lower()](self, user_id, argument)
             
-            # Handle special commands
-            if message_body_lower in ['hello', 'hi', 'start']:
-                return self._get_welcome_message(user["name"])
-            
-            elif message_body_lower in ['help', '?']:
-                return self._get_help_message()
+            # Regular query with conversation context
+            response = run_rag_job(self.user_rag_system.query_with_context, user_id, message_body)
+            return f"🤖 {response}"
+        
+        except Exception as e:
+            logging.error("Error handling WhatsApp message: %s", e)
+            return ERROR_TEXT
+    
+    def _handle_media_upload(self, from_number: str, user_id: str, media_url: str, media_type: str) -> str:
+        """Handle file uploads from WhatsApp"""
+        try:
+            # Turn away types we can't index before downloading anything
+            kind = media_type.lower()
+            if 'image' in kind:
+                return "📷 Image received! Note: Image text extraction coming soon. For now, please upload PDF or text files."
             
-            elif message_body_lower == 'stats':
-                return self._get_user_stats_message(user_id)
+            elif 'pdf' not in kind and 'text' not in kind:
+                return f"❓ Unsupported file type: {media_type}\n\nPlease upload PDF or text files."
             
-            elif message_body_lower == 'clear':
-                self.user_rag_system.clear_conversation(user_id)
-                return "✅ Conversation history cleared! Starting fresh."
+            # Download the media, refusing files over the size limit before they fill memory
+            limit = self.config.MAX_UPLOAD_BYTES
+            too_large = f"❌ File is too large. Please upload files under {limit // (1024 * 1024)} MB."
+            with self._http.get(media_url, timeout=30, stream=True) as response:
+                if response.status_code != 200:
+                    return "❌ Failed to download the file. Please try again."
+                
+                if int(response.headers.get('Content-Length') or 0) > limit:
+                    return too_large
+                
+                buf = bytearray()
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    buf += chunk
+                    if len(buf) > limit:
+                        return too_large
+            content = bytes(buf)
             
-            elif message_body_lower.startswith('research '):
-                # Research a topic and add to user's KB
-                topic = message_body[9:].strip()
-                return self._research_topic_for_user(user_id, topic)
+            # Skip files this user has already uploaded
+            content_hash = hashlib.sha256(content).hexdigest()
+            if self.user_rag_system.has_document(user_id, content_hash):
+                return DUPLICATE_TEXT
             
-            elif message_body_lower.startswith('scrape '):
-                # Scrape a URL and add to user's KB
-                url = message_body[7:].strip()
-                return self._scrape_url_for_user(user_id, url)
+            # Index in the background and message the user when done, so Twilio's webhook doesn't time out
+            if self.twilio_client:
+                if not self._ingest_slots.acquire(blocking=False):
+                    return BUSY_TEXT
+                future = self._ingest_pool.submit(self._ingest_and_notify, from_number, user_id, content, content_hash, kind)
+                future.add_done_callback(lambda _: self._ingest_slots.release())
+                return PROCESSING_TEXT
             
-            else:
-                # Regular query with conversation context
-                response = self.user_rag_system.query_with_context(user_id, message_body)
-                return f"🤖 {response}"
-        
+            return run_rag_job(self._ingest_upload, user_id, content, content_hash, kind)
+                
         except Exception as e:
-            logging.error(f"Error handling WhatsApp message: {str(e)}")
-            return "Sorry, I encountered an error processing your message. Please try again."
+            logging.error("Error handling media upload: %s", e)
+            return f"❌ Error processing file: {str(e)}"
     
-    def _handle_media_upload(self, user_id: str, media_url: str, media_type: str) -> str:
-        """Handle file uploads from WhatsApp"""
+    def _ingest_upload(self, user_id: str, content: bytes, content_hash: str, kind: str) -> str:
+        """Add a downloaded PDF or text file to the user's knowledge base and describe the result"""
         try:
-            # Download the media
-            headers = {
-                'Authorization': f'Basic {self.config.TWILIO_ACCOUNT_SID}:{self.config.TWILIO_AUTH_TOKEN}'
-            }
-            response = requests.get(media_url, headers=headers, timeout=30)
-            
-            if response.status_code != 200:
-                return "❌ Failed to download the file. Please try again."
+            # A queued duplicate may have been indexed since it was accepted
+            if self.user_rag_system.has_document(user_id, content_hash):
+                return DUPLICATE_TEXT
             
-            # Handle different file types
-            if 'pdf' in media_type.lower():
-                # Process PDF
-                pdf_reader = PyPDF2.PdfReader(io.BytesIO(response.content))
-                text = ""
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-                
-                metadata = {"source": "whatsapp_upload", "type": "pdf"}
-                result = self.user_rag_system.add_document_for_user(user_id, text, metadata)
+            if 'pdf' in kind:
+                # Process PDF, embedding pages as they are extracted
+                metadata = {"source": "whatsapp_upload", "type": "pdf", "content_hash": content_hash}
+                result = self.user_rag_system.add_pages_for_user(user_id, iter_pdf_pages(content), metadata)
                 return f"📄 *PDF Uploaded!*\n\n{result}\n\nYou can now ask questions about this document!"
             
-            elif 'image' in media_type.lower():
-                return "📷 Image received! Note: Image text extraction coming soon. For now, please upload PDF or text files."
-            
-            elif 'text' in media_type.lower():
+            else:
                 # Process text file
-                text = response.content.decode('utf-8')
-                metadata = {"source": "whatsapp_upload", "type": "text"}
+                text = content.decode('utf-8')
+                metadata = {"source": "whatsapp_upload", "type": "text", "content_hash": content_hash}
                 result = self.user_rag_system.add_document_for_user(user_id, text, metadata)
                 return f"📝 *Text File Uploaded!*\n\n{result}\n\nYou can now ask questions about this document!"
-            
-            else:
-                return f"❓ Unsupported file type: {media_type}\n\nPlease upload PDF or text files."
-                
+        
         except Exception as e:
-            logging.error(f"Error handling media upload: {str(e)}")
+            logging.error("Error processing uploaded file: %s", e)
             return f"❌ Error processing file: {str(e)}"
     
+    def _ingest_and_notify(self, from_number: str, user_id: str, content: bytes, content_hash: str, kind: str):
+        """Background job: index an upload under a shared RAG job slot, then send the result as a new message"""
+        self.send_message(from_number, run_rag_job(self._ingest_upload, user_id, content, content_hash, kind))
+    
     def _get_welcome_message(self, name: str) -> str:
         """Get welcome message"""
-        return f"""
-🤖 *Welcome back, {name}!*
-
-I'm your personal RAG Bot with conversation memory!
-
-✨ *What I can do:*
-• Remember our conversation (like ChatGPT)
-• Answer questions from YOUR private knowledge base
-• Accept file uploads (PDFs, text files)
-• Research topics and learn from the web
-
-📤 *Upload files:* Just send me a PDF or text file!
-💬 *Ask anything:* I'll remember our conversation context
-
-Type 'help' for commands!
-        """
+        return WELCOME_TEMPLATE.format(name=name)
     
     def _get_help_message(self) -> str:
         """Get help message"""
-        return """
-🤖 *RAG Bot Help*
-
-*Commands:*
-• hello/hi - Get welcome message
-• help/? - Show this help
-• stats - Show YOUR personal statistics
-• clear - Clear conversation history
-• research <topic> - Research and add to YOUR knowledge base
-• scrape <url> - Add website content to YOUR knowledge base
-
-*File Uploads:*
-📤 Just send me a PDF or text file - I'll add it to YOUR private knowledge base!
-
-*Conversation:*
-💬 I remember our conversation context (like ChatGPT)
-🔒 Your data is private and isolated from other users
-
-*Examples:*
-• "What did we talk about earlier?"
-• "Tell me more about that"
-• Send a PDF → Ask questions about it
-• "research healthy diets"
-
-I'll remember our conversation and search YOUR private knowledge base!
-        """
+        return HELP_TEXT
     
     def _get_user_stats_message(self, user_id: str) -> str:
         """Get user statistics message"""
         try:
             stats = self.user_rag_system.get_user_stats(user_id)
-            return f"""
-📊 *Your Personal Stats*
-
-👤 Name: {stats['name']}
-📅 Member since: {stats['member_since']} days ago
-💬 Total messages: {stats['total_messages']}
-📚 Documents in your KB: {stats['total_documents']}
-
-Your knowledge base is private and secure! 🔒
-            """
+            return STATS_TEMPLATE.format(**stats)
         except Exception as e:
             return f"Error getting stats: {str(e)}"
     
+    def _handle_welcome(self, user: dict) -> str:
+        """Handle hello/hi/start"""
+        return self._get_welcome_message(user["name"])
+    
+    def _handle_help(self, user: dict) -> str:
+        """Handle help/?"""
+        return self._get_help_message()
+    
+    def _handle_stats(self, user: dict) -> str:
+        """Handle stats"""
+        return self._get_user_stats_message(user["user_id"])
+    
+    def _handle_clear(self, user: dict) -> str:
+        """Handle clear"""
+        self.user_rag_system.clear_conversation(user["user_id"])
+        return CLEARED_TEXT
+    
+    # Exact-match commands; research/scrape take an argument and live in _ARG_COMMANDS
+    _COMMANDS = {
+        "hello": _handle_welcome,
+        "hi": _handle_welcome,
+        "start": _handle_welcome,
+        "help": _handle_help,
+        "?": _handle_help,
+        "stats": _handle_stats,
+        "clear": _handle_clear
+    }
+    
     def create_twiml_response(self, response_text: str) -> str:
         """Create TwiML response for Twilio webhook"""
-        resp = MessagingResponse()
-        resp.message(response_text)
-        return str(resp)
+        return _STATIC_TWIML.get(response_text) or _build_twiml(response_text)
     
     def _research_topic_for_user(self, user_id: str, topic: str) -> str:
         """Research a topic and add to user's knowledge base"""
         try:
-            from web_research import WebResearcher
-            researcher = WebResearcher()
-            
             # Research the topic
-            result = researcher.research_topic(topic)
+            result = run_rag_job(self._researcher.research_topic, topic)
             
             # The research already adds to global KB, but we should add to user's KB too
             # For now, return the result
@@ -202,11 +283,8 @@ Your knowledge base is private and secure! 🔒
     def _scrape_url_for_user(self, user_id: str, url: str) -> str:
         """Scrape URL and add to user's knowledge base"""
         try:
-            from web_research import WebResearcher
-            researcher = WebResearcher()
-            
             # Scrape the URL
-            scrape_result = researcher.scrape_url(url)
+            scrape_result = self._researcher.scrape_url(url)
             
             if scrape_result['success']:
                 # Add to user's private knowledge base
@@ -215,7 +293,8 @@ Your knowledge base is private and secure! 🔒
                     "url": url,
                     "title": scrape_result['title']
                 }
-                result = self.user_rag_system.add_document_for_user(
+                result = run_rag_job(
+                    self.user_rag_system.add_document_for_user,
                     user_id, 
                     scrape_result['content'], 
                     metadata
@@ -227,6 +306,22 @@ Your knowledge base is private and secure! 🔒
         except Exception as e:
             return f"Error scraping URL: {str(e)}"
     
+    # Commands followed by an argument, keyed by their first word
+    _ARG_COMMANDS = {
+        "research": _research_topic_for_user,
+        "scrape": _scrape_url_for_user
+    }
+    
+    # Matches a whole message that is a command, without lowercasing or copying long bodies.
+    # As before, an argument command is separated from its argument by a space
+    _CMD_RE = re.compile(
+        r"\s*(?:(%s)|(%s) \s*(.*\S))\s*$" % (
+            "|".join(map(re.escape, _COMMANDS)),
+            "|".join(map(re.escape, _ARG_COMMANDS))
+        ),
+        re.IGNORECASE | re.DOTALL
+    )
+    
     def send_message(self, to_number: str, message: str) -> bool:
         """Send a message via WhatsApp"""
         if not self.twilio_client:
@@ -239,9 +334,9 @@ Your knowledge base is private and secure! 🔒
                 from_=f'whatsapp:{self.config.TWILIO_PHONE_NUMBER}',
                 to=f'whatsapp:{to_number}'
             )
-            logging.info(f"Message sent successfully: {message.sid}")
+            logging.info("Message sent successfully: %s", message.sid)
             return True
         
         except Exception as e:
-            logging.error(f"Error sending WhatsApp message: {str(e)}")
+            logging.error("Error sending WhatsApp message: %s", e)
             return False
\ No newline at end of file